@@ -1,8 +1,12 @@
 import os
+import gzip
 import json
-import fire
+import contextlib
 from glob import glob
 
+from utils import profiling
+from utils.score_index import ScoreIndex
+
 SYS_PROMPT = """You are a helpful assistant tasked with analyzing sports games. You have been given a play-by-play breakdown of an NBA basketball game between two teams.\n
 The "Time" column shows the exact time on the game clock when each play took place. The game clock counts down, so this column displays times in a descending order.\n
 The "Play" column describes the action that happened at the respective times. It provides details of specific plays, movements, and outcomes on the court.\n
@@ -16,20 +20,6 @@ def load_json(fpath):
         return j_data
 
     
-def batchit(corpus, size=128):
-    assert hasattr(corpus, "__iter__")
-    assert size is None or isinstance(size, int) and size > 0
-    batched_corpus = []
-    batch = []
-    for row in corpus:
-        batch.append(row)
-        if len(batch) == size:
-            batched_corpus.append(batch.copy())
-            batch.clear()
-    if len(batch) > 0:
-        batched_corpus.append(batch)
-    return batched_corpus
-
 def team_score(team_players):
     initial_scores = {k:0 for k in team_players.keys()}
     team_affiliations = ""
@@ -40,42 +30,63 @@ def team_score(team_players):
 
     return [task_prompt]
 
-def initial_team_scores(pbp_data):
-    init_score = {}
-    for play in pbp_data[0]:
-        if play['ScoringPlay']:
-            init_score[play['team']] = 0
-        if len(init_score.keys()) == 2:
-            break
-    return init_score
+def play_lines(quarter):
+    return [play['time'] + "\t" + play['description'] + "\n" for play in quarter]
+
+def line_token_counts(lines):
+    from utils.stats import get_encoder
+    return [len(tokens) for tokens in get_encoder().encode_ordinary_batch(lines)]
+
+def segment_bounds(num_plays, step_size=False, token_budget=None, line_tokens=None):
+    """
+        Windows [(start, end, num_tokens)] cutting a quarter of num_plays plays into segments of step_size plays,
+        of at most token_budget tokens given the line_tokens of every play (a play longer than the budget gets
+        a segment of its own), or one segment otherwise. num_tokens is None without token_budget.
+    """
+    if token_budget:
+        bounds = []
+        start, segment_tokens = 0, 0
+        for i, tokens in enumerate(line_tokens):
+            if i > start and segment_tokens + tokens > token_budget:
+                bounds.append((start, i, segment_tokens))
+                start, segment_tokens = i, 0
+            segment_tokens += tokens
+        if start < num_plays:
+            bounds.append((start, num_plays, segment_tokens))
+        return bounds
+    if step_size:
+        return [(start, min(start + step_size, num_plays), None) for start in range(0, num_plays, step_size)]
+    return [(0, num_plays, None)]
 
+def iter_segments(pbp_data, step_size=False, token_budget=None, index=None, lines=None, line_tokens=None):
+    """
+        Yield (segment id, description, ground truth, num_tokens, (quarter, start, end)) for every segment of
+        every quarter, the last item locates the segment's plays for index.player_truth.
+        step_size: segments of step_size plays, token_budget: segments of at most token_budget tokens,
+        whole quarters otherwise. num_tokens is only counted with token_budget, None otherwise.
+        index, lines, line_tokens: the game's ScoreIndex, play lines and line tokens of every quarter when they
+                                   are shared by several calls, computed otherwise
+    """
+    if index is None:
+        index = ScoreIndex(pbp_data)
+    if lines is None:
+        lines = [play_lines(quarter) for quarter in pbp_data]
+    if token_budget and line_tokens is None:
+        line_tokens = [line_token_counts(quarter_lines) for quarter_lines in lines]
+    for quarter_id, quarter_lines in enumerate(lines):
+        quarter_tokens = line_tokens[quarter_id] if token_budget else None
+        bounds = segment_bounds(len(quarter_lines), step_size, token_budget, quarter_tokens)
+        for seg_id, (start, end, num_tokens) in enumerate(bounds, 1):
+            # O(1) truth from the cumulative scores, whatever the segment size
+            ground_truth = index.team_truth(quarter_id, start, end)
+            yield (f"{quarter_id + 1}_{seg_id}", "".join(quarter_lines[start:end]), ground_truth, num_tokens,
+                   (quarter_id, start, end))
+    return
 
-def generate_pbp_desc(pbp_data, step_size=False):
+def generate_pbp_desc(pbp_data, step_size=False, token_budget=None):
     # yield quarter description and ground truth 
-    quarter_id = 0
-    init_team_scores = initial_team_scores(pbp_data)
-    for quarter in pbp_data:
-        quarter_id += 1
-        if step_size:
-            quarter_data = batchit(quarter, step_size)
-        else:
-            quarter_data = [quarter]
-        seg_id = 0
-        # process
-        for segment in quarter_data:
-            pbp_desc = ""
-            ground_truth = init_team_scores.copy()
-            seg_id += 1
-            for play in segment:
-                play_desc = play['time'] + "\t" + play['description']
-                pbp_desc += play_desc + '\n'
-
-                # record ground truth
-                if play['team'] not in ground_truth.keys() and play['ScoringPlay']:
-                    ground_truth[play['team']] = play['points']
-                elif play['ScoringPlay']:
-                    ground_truth[play['team']] += play['points']
-            yield f"{quarter_id}_{seg_id}", pbp_desc, ground_truth
+    for seg_id, desc, ground_truth, _, _ in iter_segments(pbp_data, step_size, token_budget):
+        yield seg_id, desc, ground_truth
     return
 
 def player_scores(team_players):
@@ -93,49 +104,284 @@ def player_scores(team_players):
         task_prompts.append((team, task_prompt))
     return task_prompts
 
-def task_generate(game_folder, bench_name, steps, player_stats):
+def iter_games(game_folder):
+    # load games one at a time, memory only holds the current game
+    from utils.GameStore import GameStore, is_game_store
+    if is_game_store(game_folder):
+        yield from GameStore(game_folder).iter_games()
+        return
+    for fpath in sorted(glob(os.path.join(game_folder, "*.json"))):
+        game_name = fpath.split("/")[-1].split(".")[0]
+        with profiling.stage("load_game"):
+            game = load_json(fpath)
+        yield game_name, game
+
+def task_prompts(team_players, player_stats):
+    # [(team, prompt)], team is None for the team score task
+    if player_stats:
+        return player_scores(team_players)
+    return [(None, prompt) for prompt in team_score(team_players)]
+
+def game_instance_parts(game_name, jdata, variants, token_budget=None):
+    """
+        Instance parts of one game for several (steps, player_stats) variants, {variant: [parts]}.
+        The play lines, their tokens and the cumulative score index are built once for all the variants,
+        the truth of every segment is then read off the index.
+    """
+    team_players = jdata['team_players']
+    index = ScoreIndex(jdata['pbp'], team_players)
+    lines = [play_lines(quarter) for quarter in jdata['pbp']]
+    line_tokens = None
+    if token_budget:
+        line_tokens = [line_token_counts(quarter_lines) for quarter_lines in lines]
+    prompts, prompt_tokens, segments = {}, {}, {}
+    parts = {}
+    for steps, player_stats in variants:
+        if player_stats not in prompts:
+            prompts[player_stats] = task_prompts(team_players, player_stats)
+            if token_budget:
+                from utils.stats import get_encoder
+                prompt_tokens[player_stats] = {team: len(get_encoder().encode_ordinary(prompt))
+                                               for team, prompt in prompts[player_stats]}
+        if steps not in segments:
+            segments[steps] = list(iter_segments(jdata['pbp'], steps, token_budget, index, lines, line_tokens))
+        instances = parts[(steps, player_stats)] = []
+        for step_id, desc, g, num_tokens, (quarter_id, start, end) in segments[steps]:
+            for team, task_prompt in prompts[player_stats]:
+                truth = g
+                player_truth = index.player_truth(quarter_id, start, end, team) if player_stats else None
+                if player_truth is not None:
+                    players = team_players[team]
+                    truth = {p: 0 for p in players}
+                    for i, points in enumerate(player_truth):
+                        truth[players[i]] += points
+                instance = {
+                    "instance_id": game_name + (f"_{team}" if player_stats else "") + f"_{step_id}",
+                    "system": SYS_PROMPT,
+                    "header": task_prompt,
+                    "segment": desc,
+                    "truth": truth
+                }
+                if token_budget:
+                    # the prompt ends with "Time\tPlay\n" and lines start with digits, the counts add up
+                    instance["num_tokens"] = prompt_tokens[player_stats][team] + num_tokens
+                instances.append(instance)
+    return parts
+
+def iter_instance_parts(games, steps, player_stats, token_budget=None):
+    """
+        Yield evaluation instances for (game_name, game) pairs, one game at a time, with their prompt in parts:
+        {"instance_id", "system", "header", "segment", "truth"}, system_msg = system and prompt_msg = header + segment.
+        token_budget: segment quarters by tokens instead of steps, instances then record the
+                      "num_tokens" of their prompt_msg
+        With player_stats the truth is {player: points} of the team, for games with structured play fields.
+        Older games only have the team scores.
+    """
+    for game_name, jdata in games:
+        profiling.count("games")
+        yield from game_instance_parts(game_name, jdata, [(steps, player_stats)], token_budget)[(steps, player_stats)]
+
+def plain_instance(part):
+    # an instance as written to plain benchmark files
+    instance = {
+        "instance_id": part["instance_id"],
+        "system_msg": part["system"],
+        "prompt_msg": part["header"] + part["segment"],
+        "truth": part["truth"]
+    }
+    if "num_tokens" in part:
+        instance["num_tokens"] = part["num_tokens"]
+    return instance
+
+def iter_instances(games, steps, player_stats, token_budget=None):
+    # instances as written to plain benchmark files
+    for part in iter_instance_parts(games, steps, player_stats, token_budget):
+        yield plain_instance(part)
+
+def render_game(game_name, game, steps, player_stats, token_budget=None, shared_prefix=False, keep_game=False):
+    """
+        Instances of one game, e.g. in the worker process that simulated it: serialized JSON lines, or instance parts
+        with shared_prefix (the writer deduplicates their texts). Returns (game if keep_game else None, instances).
+    """
+    games = [(game_name, game)]
+    if shared_prefix:
+        instances = list(iter_instance_parts(games, steps, player_stats, token_budget))
+    else:
+        instances = [json.dumps(instance) + "\n" for instance in iter_instances(games, steps, player_stats, token_budget)]
+    return (game if keep_game else None), instances
+
+def open_output(save_file, compress=False):
+    if compress:
+        return gzip.open(save_file, 'wt')
+    return open(save_file, 'w')
+
+class JsonlWriter:
+    """
+        JSON lines written to save_file under a ".part" name, buffered by buffer_size lines.
+        close() renames the file once complete, discard() leaves the partial file behind.
+    """
+    def __init__(self, save_file, buffer_size=1000):
+        self.save_file = save_file
+        self.part_file = save_file + ".part"
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.total = 0
+        self.w = open_output(self.part_file, compress=save_file.endswith(".gz"))
+
+    def write(self, instance):
+        # instances are dicts, or lines already serialized (e.g. by render_game in worker processes)
+        self.buffer.append(instance if isinstance(instance, str) else json.dumps(instance) + "\n")
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.w.writelines(self.buffer)
+        self.total += len(self.buffer)
+        self.buffer.clear()
+
+    def discard(self):
+        self.w.close()
+
+    def close(self):
+        self.flush()
+        self.w.close()
+        os.replace(self.part_file, self.save_file)
+        return self.total
+
+def write_jsonl(instances, save_file, buffer_size=1000):
+    """
+        Stream instances to save_file as JSON lines, flushing every buffer_size lines.
+        Instances are dicts, or lines already serialized (e.g. by render_game in worker processes).
+        The file is written under a ".part" name and renamed once complete.
+    """
+    writer = JsonlWriter(save_file, buffer_size)
+    profiled = profiling.enabled
+    t = profiling.now() if profiled else 0
+    try:
+        for instance in instances:
+            # "render" is the time to produce an instance, loading the game included
+            if profiled:
+                t = profiling.lap("render", t)
+            writer.write(instance)
+            if profiled:
+                t = profiling.lap("write", t)
+    except BaseException:
+        writer.discard()
+        raise
+    total = writer.close()
+    profiling.count("instances", total)
+    return total
+
+def bench_file(bench_name, steps, player_stats, token_budget=None, compress=False, shared_prefix=False):
+    # full benchmark name with the task options, and the file it is saved to
+    if steps and token_budget:
+        raise ValueError("Use either steps or token_budget to segment quarters")
     if steps:
         bench_name += f"-step_{steps}"
+    if token_budget:
+        bench_name += f"-tokens_{token_budget}"
     if player_stats:
         bench_name += "-player_stats"
         
-    save_file = os.path.join("benchmarks",f"{bench_name}.json")
-    
-    if os.path.exists(save_file):
-        print(f"File {save_file} already exists.")
+    save_file = os.path.join("benchmarks",f"{bench_name}.shared.json" if shared_prefix else f"{bench_name}.json")
+    if compress:
+        save_file += ".gz"
+    return bench_name, save_file
+
+def write_benchmark(instances, save_file, shared_prefix=False):
+    """
+        Write instances (parts of iter_instance_parts with shared_prefix) to save_file, returns the number of instances.
+    """
+    if not shared_prefix:
+        return write_jsonl(instances, save_file)
+    from utils.benchfile import shared_records
+    stats = {}
+    write_jsonl(shared_records(instances, stats), save_file)
+    print(f"Shared texts: {stats['system']} system prompts, {stats['header']} task headers, {stats['segment']} segments")
+    return stats["instances"]
+
+def write_variants(games, outputs, token_budget=None, shared_prefix=False):
+    """
+        Write the benchmark files of several (steps, player_stats) variants from a single pass over games.
+        outputs: {variant: save_file}. Returns {variant: number of instances}.
+    """
+    from utils.benchfile import SharedTables, format_record
+    writers = {variant: JsonlWriter(save_file) for variant, save_file in outputs.items()}
+    tables = {}
+    if shared_prefix:
+        for variant, writer in writers.items():
+            tables[variant] = SharedTables()
+            writer.write(format_record())
+    try:
+        for game_name, game in games:
+            profiling.count("games")
+            with profiling.stage("render"):
+                parts = game_instance_parts(game_name, game, list(outputs), token_budget)
+            with profiling.stage("write"):
+                for variant, writer in writers.items():
+                    for part in parts[variant]:
+                        if shared_prefix:
+                            for record in tables[variant].records(part):
+                                writer.write(record)
+                        else:
+                            writer.write(plain_instance(part))
+    except BaseException:
+        for writer in writers.values():
+            writer.discard()
+        raise
+    totals = {}
+    for variant, writer in writers.items():
+        writer.close()
+        totals[variant] = tables[variant].stats["instances"] if shared_prefix else writer.total
+        profiling.count("instances", totals[variant])
+        if shared_prefix:
+            stats = tables[variant].stats
+            print(f"{outputs[variant]}: {stats['system']} system prompts, {stats['header']} task headers, "
+                  f"{stats['segment']} segments shared")
+    return totals
+
+def as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+def task_generate(game_folder, bench_name, steps, player_stats, compress=False, profile=False, profile_pstats=False,
+                  token_budget=None, shared_prefix=False):
+    """
+        steps, player_stats: a value or a list of values, e.g. -steps "[5,10,20,False]" -player_stats "[False,True]",
+                             every combination is written to its own file from a single read of each game
+        shared_prefix: write "benchmarks/{bench_name}.shared.json", storing the system prompt, task headers and
+                       play-by-play segments once and instances as references to them, read back with
+                       utils.benchfile.read_benchmark
+        token_budget: cut quarters into segments of at most token_budget tokens of play-by-play lines instead of
+                      steps, each instance records the "num_tokens" of its prompt
+        compress: write a gzip compressed "benchmarks/{bench_name}.json.gz"
+        profile: save stage timings and counters to "benchmarks/{bench_name}.profile.json"
+        profile_pstats: with profile, also dump cProfile stats next to it
+    """
+    outputs, names = {}, []
+    for task in as_list(player_stats):
+        for step_size in as_list(steps):
+            name, save_file = bench_file(bench_name, step_size, task, token_budget, compress, shared_prefix)
+            if os.path.exists(save_file):
+                print(f"File {save_file} already exists.")
+                continue
+            outputs[(step_size, task)] = save_file
+            names.append(name)
+    if not outputs:
         return
+    os.makedirs("benchmarks", exist_ok=True)
     
-    # safe all evaluation instances in one file
-    bench_data = []
-    for fpath in glob(os.path.join(game_folder, "*.json")):
-        jdata = load_json(fpath)
-        game_name = fpath.split("/")[-1].split(".")[0]
-        if player_stats:
-            task_prompts = player_scores(jdata['team_players'])
-        else:
-            task_prompts = team_score(jdata['team_players'])
-        for step_id, desc, g in generate_pbp_desc(jdata['pbp'], steps):
-            if player_stats:
-                bench_data.extend([{
-                    "instance_id": game_name + f"_{task_prompt[0]}" + f"_{step_id}", 
-                    "system_msg": SYS_PROMPT,
-                    "prompt_msg": task_prompt[1] + desc,
-                    "truth": g
-                }] for task_prompt in task_prompts)
-            else:
-                bench_data.append({
-                    "instance_id": game_name + f"_{step_id}", 
-                    "system_msg": SYS_PROMPT,
-                    "prompt_msg": task_prompts[0] + desc,
-                    "truth": g
-                })
-    
-    print(f"Load {len(bench_data)} instances from {game_folder}\nSave to {save_file}")
-    with open(save_file, 'w') as w:
-        for instance in bench_data:
-            w.write(json.dumps(instance) + "\n")
+    profile_context = contextlib.nullcontext()
+    if profile:
+        profile_name = names[0] if len(names) == 1 else bench_name
+        profile_context = profiling.profile_run(os.path.join("benchmarks", f"{profile_name}.profile.json"), pstats=profile_pstats)
+    # stream evaluation instances into every file, game by game
+    with profile_context:
+        totals = write_variants(iter_games(game_folder), outputs, token_budget, shared_prefix)
+    for variant, save_file in outputs.items():
+        print(f"Load {totals[variant]} instances from {game_folder}\nSave to {save_file}")
     
     return
 
 if __name__=="__main__":
-    fire.Fire(task_generate)
\ No newline at end of file
+    import fire
+    fire.Fire(task_generate)
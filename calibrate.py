@@ -0,0 +1,38 @@
+import fire
+
+from utils.calibration import calibrate_alpha, calibration_path, load_curves, settings_key
+from utils.GameModel import GameModel
+
+
+def calibrate(ratio=None, tokens=None, games=200, seed=0, strong_team_strength=90, weak_team_strength=70, tolerance=0.01,
+              curve=False):
+    """
+        Search the alpha of simulation.py that gives a target S:NS ratio with fixed-seed batch simulations of games games.
+        ratio: e.g. "1:4", any ratio between about 1:1.4 and 1:15
+        tokens: optional target of average tokens per quarter, measured at the calibrated alpha and compared
+                (needs the tiktoken encoding)
+        tolerance: accepted relative error on the ratio
+        curve: print the cached alpha curve for these settings instead
+        Measured points are cached in model_data/compiled, repeated or nearby targets are found immediately.
+    """
+    if curve:
+        model = GameModel.load()
+        points = load_curves(calibration_path(model)).get(settings_key(games, seed, strong_team_strength, weak_team_strength), [])
+        for point in points:
+            tokens_text = f"{point['tokens']:.1f}" if point["tokens"] is not None else "-"
+            print(f"alpha {point['alpha']:8.4f}  S: NS 1:{point['ratio_value']:.2f}  density {point['density']:.4f}  tokens {tokens_text}")
+        return
+    if ratio is None:
+        raise ValueError("Give a target -ratio, e.g. 1:4")
+    alpha, point = calibrate_alpha(ratio, games, seed, strong_team_strength, weak_team_strength, tolerance,
+                                   count_tokens=tokens is not None)
+    print(f"alpha: {alpha}, S: NS is 1:{point['ratio_value']:.2f}")
+    if tokens is not None:
+        print(f"average #tokens per quarter: {point['tokens']:.1f} (target {tokens})")
+        # a quarter ends with its 12 minutes of game clock, alpha changes tokens per quarter by a few percent only
+        if abs(point["tokens"] - tokens) > tolerance * tokens:
+            print("Tokens per quarter are bounded by the game clock, use benchmark.py -token_budget to size prompts")
+    return
+
+if __name__ == "__main__":
+    fire.Fire(calibrate)
@@ -5,4 +5,6 @@ python benchmark.py \
     -player_stats False
 
 # steps: integer, default=False, create benchmark task seperated in steps.
+# token_budget: integer, optional, separate quarters into segments of at most token_budget tokens instead of steps.
 # player_stats: True for player stats prediction
+# shared_prefix: True to store prompts and segments once and instances as references (benchmarks/{bench_name}.shared.json)
@@ -0,0 +1,43 @@
+import json
+import fire
+
+from utils.evaluation import evaluate_file, DEFAULT_TOLERANCES
+
+
+def evaluate(bench_file, pred_file, tolerances=None, by="quarter,step", bootstrap=1000, confidence=0.95, seed=0,
+             output=None):
+    """
+        Score predictions against a benchmark file of benchmark.py.
+        pred_file: JSON lines {"instance_id", "prediction": {team or player: score}}
+        tolerances: DCA tolerances T, e.g. "0,1,2,5,10" (default 0..10)
+        by: comma separated breakdowns among game, quarter, step, team
+        bootstrap: number of bootstrap samples over games for the confidence intervals, 0 to skip
+        output: optional JSON file for the full report
+    """
+    if tolerances is None:
+        tolerances = DEFAULT_TOLERANCES
+    elif isinstance(tolerances, str):
+        tolerances = [int(t) for t in tolerances.split(",")]
+    elif isinstance(tolerances, int):
+        tolerances = [tolerances]
+    if isinstance(by, str):
+        by = [b for b in by.split(",") if b]
+    report = evaluate_file(bench_file, pred_file, tolerances, by, bootstrap, confidence, seed)
+
+    overall = report["overall"]
+    print(f"#scores: {overall['n']}, answered: {overall['answered']:.3f}, exact match: {overall['exact_match']:.4f}, MAE: {overall['mae']:.3f}")
+    for t, dca in overall["dca"].items():
+        ci = overall.get("ci", {}).get("dca", {}).get(t)
+        print(f"DCA(T={t}): {dca:.4f}" + (f"  [{ci[0]:.4f}, {ci[1]:.4f}]" if ci else ""))
+    for key, breakdown in report["by"].items():
+        print(f"by {key}:")
+        for level, metrics in breakdown.items():
+            dca = ", ".join(f"T={t}: {v:.4f}" for t, v in metrics["dca"].items())
+            print(f"  {level:<12} n={metrics['n']:<8} exact={metrics['exact_match']:.4f} MAE={metrics['mae']:.3f} DCA {dca}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return
+
+if __name__ == "__main__":
+    fire.Fire(evaluate)
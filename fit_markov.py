@@ -0,0 +1,43 @@
+import os
+import fire
+import pickle
+
+from utils.GameModel import GameModel, MODEL_DIR, load_pickle
+from utils.markov_fit import fit_counts, counts_path, BACKOFF_MIN_COUNT
+
+
+def fit_markov(add=None, orders=(1, 2, 3), min_count=BACKOFF_MIN_COUNT, build=None, model_dir=MODEL_DIR):
+    """
+        Count the transitions of the real event sequences and report the turn model of every order.
+        Counts are cached in "{model_dir}/compiled", only sequences not counted yet are counted.
+        add: pickle of newly collected sequences [["start", ..., "end"], ...], appended to event_seqs.pkl
+        orders: Markov orders to report, the number of states of their chain
+        min_count: contexts seen fewer times back off to a shorter one
+        build: compile the game model of this order now instead of on the first simulation
+        Simulations use the order in SPORTSGEN_MARKOV_ORDER (default 1).
+    """
+    seqs_path = os.path.join(model_dir, "event_seqs.pkl")
+    seqs = load_pickle(seqs_path)
+    if add is not None:
+        new_seqs = [list(seq) for seq in load_pickle(add)]
+        seqs = seqs + new_seqs
+        tmp_path = f"{seqs_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(seqs, f)
+        os.replace(tmp_path, seqs_path)
+        print(f"Add {len(new_seqs)} sequences to {seqs_path}")
+
+    counts, counted = fit_counts(seqs, counts_path(model_dir))
+    print(f"{counts.num_sequences} sequences, {len(counts.events)} events, {counted} counted now")
+    for order in range(1, counts.max_order + 1):
+        print(f"order {order}: {len(counts.counts[order][1])} transitions")
+    for order in ([orders] if isinstance(orders, int) else orders):
+        states = counts.chain(order, min_count)[0]
+        print(f"order {order} chain: {len(states)} states")
+    if build is not None:
+        model = GameModel.load(model_dir, order=build)
+        print(f"Game model of order {model.markov_order}: {model.source_hash[:16]}")
+    return
+
+if __name__ == "__main__":
+    fire.Fire(fit_markov)
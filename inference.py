@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import fire
+
+from utils.llm import LLMBackend, RateLimiter, CONFIG_PATH
+from utils.evaluation import parse_score_block
+from utils.benchfile import read_benchmark, read_prefix_ordered
+
+
+def completed_ids(output_file):
+    # instance ids already answered, a torn last line of an interrupted run is ignored
+    done = set()
+    if not os.path.exists(output_file):
+        return done
+    with open(output_file, 'r') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["instance_id"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return done
+
+def instance_messages(instance):
+    return [
+        {"role": "system", "content": instance["system_msg"]},
+        {"role": "user", "content": instance["prompt_msg"]}
+    ]
+
+async def run_instances(backend, instances, output_file, params, concurrency):
+    """
+        Send instances with at most concurrency requests in flight and append every answer to output_file
+        as soon as it arrives. Failed instances are not written, so a rerun retries them.
+    """
+    import asyncio
+    from tqdm import tqdm
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = tqdm()
+    counts = {"done": 0, "failed": 0}
+    with open(output_file, 'a') as w:
+        async def worker():
+            # workers share the instance iterator, the file is streamed instead of loaded
+            for instance in instances:
+                response = await backend.acomplete(instance_messages(instance), semaphore,
+                                                   cache_key=[instance["instance_id"]], **params)
+                progress.update(1)
+                if response is None:
+                    counts["failed"] += 1
+                    continue
+                w.write(json.dumps({
+                    "instance_id": instance["instance_id"],
+                    "model": backend.model,
+                    "response": response,
+                    "prediction": parse_score_block(response),
+                }) + "\n")
+                w.flush()
+                counts["done"] += 1
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    progress.close()
+    return counts
+
+def inference(bench_file, output_file=None, model=None, base_url=None, config_path=CONFIG_PATH, concurrency=16,
+              requests_per_minute=None, tokens_per_minute=None, max_retries=5, limit=None, order="file", **params):
+    """
+        Run a model on a benchmark file of benchmark.py through an OpenAI-compatible endpoint.
+        output_file: JSON lines {"instance_id", "model", "response", "prediction"} for evaluate.py,
+                     defaults to "results/{bench name}.{model}.jsonl". Rerunning appends the missing instances only.
+        model, base_url: override the config file (e.g. base_url of a local server)
+        requests_per_minute, tokens_per_minute: client side rate limits
+        limit: only run the first limit instances of the file
+        order: "file", or "prefix" to send instances sharing a system prompt and task header one after the other
+               so that the server's prompt cache is reused (loads the instance list first)
+        params: request parameters overriding the config file, e.g. -temperature 0
+        Responses are cached by instance id, prompt, model and parameters in the shared LLM cache.
+    """
+    options = {"concurrency": concurrency, "max_retries": max_retries,
+               "rate_limiter": RateLimiter(requests_per_minute, tokens_per_minute)}
+    if model is not None:
+        options["model"] = model
+    if base_url is not None:
+        options["base_url"] = base_url
+    backend = LLMBackend.from_config(config_path, **options)
+
+    if output_file is None:
+        bench_name = os.path.basename(bench_file).split(".json")[0].removesuffix(".shared")
+        output_file = os.path.join("results", f"{bench_name}.{backend.model}.jsonl")
+    if os.path.dirname(output_file):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    done = completed_ids(output_file)
+    if done:
+        print(f"Resume {output_file}: {len(done)} instances done")
+
+    if order not in ("file", "prefix"):
+        raise ValueError(f"Unknown order {order}, use file or prefix")
+    def pending():
+        instances = read_prefix_ordered(bench_file) if order == "prefix" else read_benchmark(bench_file)
+        for i, instance in enumerate(instances):
+            if limit is not None and i >= limit:
+                return
+            if instance["instance_id"] not in done:
+                yield instance
+
+    import asyncio
+    start = time.time()
+    counts = asyncio.run(run_instances(backend, pending(), output_file, params, concurrency))
+    print(f"{counts['done']} answered, {counts['failed']} failed in {time.time() - start:.1f}s\nSave to {output_file}")
+    return
+
+if __name__ == "__main__":
+    fire.Fire(inference)
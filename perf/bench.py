@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+
+import fire
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.environ.setdefault("SPORTSGEN_OFFLINE", "1") # never reach the OpenAI API from a benchmark
+
+SEED = 0
+FIXTURE_GAMES = 20 # synthetic games for task_generate and games_statistics
+POWER = [80.0, 60.0]
+
+
+class Fixtures:
+    """
+        Inputs shared by the cases, generated with fixed seeds on first use.
+    """
+    def __init__(self):
+        self._model = None
+        self._players = None
+        self._game_folder = None
+        self.tmp_dir = tempfile.mkdtemp(prefix="sportsgen-bench-")
+
+    @property
+    def model(self):
+        if self._model is None:
+            from utils.GameModel import GameModel
+            self._model = GameModel.load()
+        return self._model
+
+    @property
+    def players(self):
+        if self._players is None:
+            from utils.NBAPlayer import select_team_players, load_team_profile
+            teams = select_team_players(90, 70, rng=random.Random(SEED))
+            self._players = load_team_profile(teams)[1]
+        return self._players
+
+    @property
+    def game_folder(self):
+        # synthetic simulation folder of FIXTURE_GAMES games
+        if self._game_folder is None:
+            from simulation import simulate_game
+            self._game_folder = os.path.join(self.tmp_dir, "games")
+            os.makedirs(self._game_folder)
+            for game_id in range(FIXTURE_GAMES):
+                _, game = simulate_game(game_id, SEED, 90, 70, 0.5, False)
+                with open(os.path.join(self._game_folder, f"game_{game_id}.json"), 'w') as f:
+                    json.dump(game, f, indent=4)
+        return self._game_folder
+
+    def close(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def case_generate_turn(fx):
+    from utils.GameGenerator import generate_turn
+    rng = random.Random(SEED)
+    return lambda: generate_turn(fx.model.markov_graph, rng=rng)
+
+def case_conditional_turn_generator(fx, alpha):
+    # one quarter's worth of turns at the density of a ratio
+    from utils.GameGenerator import conditional_turn_generator, modify_num_play_each_turn, make_or_miss
+    rng = random.Random(SEED)
+    sampler = fx.model.turn_sampler
+    def run():
+        for i in range(100):
+            num_plays = modify_num_play_each_turn(alpha, rng=rng)
+            key_event = make_or_miss(POWER[i % 2], rng=rng)
+            conditional_turn_generator(sampler, num_plays, key_event=key_event, rng=rng)
+    return run
+
+def case_get_timestamp(fx):
+    from utils.GameGenerator import get_timestamp
+    rng = random.Random(SEED)
+    path = fx.model.turn_sampler.sample(6, makes=1, rng=random.Random(SEED))
+    return lambda: get_timestamp(fx.model.duration_tables, path, "12:00", rng=rng)
+
+def case_fill_in_players(fx):
+    from utils.GameGenerator import fill_in_players
+    rng = random.Random(SEED)
+    texts = [text for candidates in fx.model.verb_to_desc.values() for text in candidates[:20]]
+    players = fx.players["team1"]
+    return lambda: [fill_in_players(text, "team1", players, rng=rng) for text in texts]
+
+def case_template_fill(fx):
+    # compiled counterpart of fill_in_players, same texts
+    rng = random.Random(SEED)
+    templates = [t for candidates in fx.model.templates.values() for t in candidates[:20]]
+    players = fx.players["team1"]
+    return lambda: [t.fill("team1", players, rng=rng) for t in templates]
+
+def case_select_team_players(fx):
+    from utils.NBAPlayer import select_team_players, load_roster
+    load_roster()
+    rng = random.Random(SEED)
+    return lambda: select_team_players(90, 70, rng=rng)
+
+def case_simulate_single_game(fx):
+    from utils.GameGenerator import simulate_single_game
+    rng = random.Random(SEED)
+    return lambda: simulate_single_game(POWER, fx.players, alpha=0.5, model=fx.model, rng=rng)
+
+def case_task_generate(fx, player_stats):
+    import benchmark
+    folder = fx.game_folder
+    work_dir = os.path.join(fx.tmp_dir, "task_generate")
+    os.makedirs(work_dir, exist_ok=True)
+    def run():
+        # task_generate writes to ./benchmarks and refuses to overwrite
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            with contextlib.redirect_stdout(None):
+                benchmark.task_generate(folder, "bench", 10, player_stats)
+        finally:
+            shutil.rmtree("benchmarks", ignore_errors=True)
+            os.chdir(cwd)
+    return run
+
+def case_games_statistics(fx):
+    from utils.stats import games_statistics, get_encoder
+    get_encoder()
+    folder = fx.game_folder
+    def run():
+        with contextlib.redirect_stdout(None):
+            games_statistics(folder, use_cache=False)
+    return run
+
+def case_dca(fx):
+    from utils.metric import DCA
+    np_rng = np.random.default_rng(SEED)
+    tgt = np_rng.integers(0, 60, 10000).tolist()
+    pred = (np.array(tgt) + np_rng.integers(-12, 13, 10000)).tolist()
+    return lambda: DCA(pred, tgt, 10)
+
+def tiktoken_available():
+    try:
+        from utils.stats import get_encoder
+        get_encoder()
+        return True
+    except Exception:
+        return False
+
+def build_cases():
+    from utils.GameGenerator import RATIO2ALPHA
+    cases = {
+        "generate_turn": case_generate_turn,
+    }
+    for ratio, alpha in RATIO2ALPHA.items():
+        cases[f"conditional_turn_generator[{ratio}]"] = lambda fx, alpha=alpha: case_conditional_turn_generator(fx, alpha)
+    cases.update({
+        "get_timestamp": case_get_timestamp,
+        "fill_in_players": case_fill_in_players,
+        "template_fill": case_template_fill,
+        "select_team_players": case_select_team_players,
+        "simulate_single_game": case_simulate_single_game,
+        "task_generate[team]": lambda fx: case_task_generate(fx, False),
+        "task_generate[player_stats]": lambda fx: case_task_generate(fx, True),
+        "games_statistics": case_games_statistics,
+        "metric.DCA": case_dca,
+    })
+    return cases
+
+def measure(fn, repeat, min_time):
+    """
+        Seconds per call (best and median of repeat rounds, each round long enough to last min_time),
+        plus peak traced memory and net allocated blocks of a single call.
+    """
+    fn() # warm up caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return {"best": min(rounds), "median": float(np.median(rounds)), "number": number,
+            "peak_bytes": peak, "net_blocks": blocks}
+
+def run(output=None, cases=None, repeat=5, min_time=0.2):
+    """
+        Time every case, print a table and optionally save the results as JSON.
+        cases: comma separated substrings, only matching cases are run
+    """
+    if output:
+        output = os.path.abspath(output)
+    # the code under test reads model_data/ relative to the working directory
+    os.chdir(REPO_DIR)
+    selected = build_cases()
+    if cases:
+        patterns = cases.split(",") if isinstance(cases, str) else list(cases)
+        selected = {name: case for name, case in selected.items() if any(p in name for p in patterns)}
+    skipped = {}
+    if not tiktoken_available():
+        for name in ["games_statistics"]:
+            if selected.pop(name, None) is not None:
+                skipped[name] = "tiktoken encoding unavailable"
+
+    fx = Fixtures()
+    results = {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+               "seed": SEED, "cases": {}, "skipped": skipped}
+    try:
+        for name, case in selected.items():
+            res = measure(case(fx), repeat, min_time)
+            results["cases"][name] = res
+            print(f"{name:<36} {res['best']*1000:10.3f} ms  {res['peak_bytes']/1024:10.1f} KiB peak  {res['net_blocks']:8d} blocks")
+    finally:
+        fx.close()
+    for name, reason in skipped.items():
+        print(f"{name:<36} skipped: {reason}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=4)
+    return
+
+def compare(baseline, current, threshold=0.1):
+    """
+        Compare two result files of run(), exit 1 when a case is more than threshold (fraction) slower.
+    """
+    with open(baseline, 'r') as f:
+        base = json.load(f)["cases"]
+    with open(current, 'r') as f:
+        cur = json.load(f)["cases"]
+    regressions = []
+    for name in cur:
+        if name not in base:
+            print(f"{name:<36} new")
+            continue
+        ratio = cur[name]["best"] / base[name]["best"]
+        status = "REGRESSION" if ratio > 1 + threshold else ""
+        if status:
+            regressions.append(name)
+        print(f"{name:<36} {base[name]['best']*1000:10.3f} -> {cur[name]['best']*1000:10.3f} ms  x{ratio:6.2f}  {status}")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "compare": compare})
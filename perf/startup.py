@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import time
+import fire
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = {
+    "simulation": "import simulation",
+    "benchmark": "import benchmark",
+    "generator": "import utils.GameGenerator",
+}
+# must never be imported just to start a job, fire and tqdm only by the CLI and the run itself
+HEAVY_MODULES = ["scipy", "networkx", "openai", "yaml", "tiktoken", "fire", "tqdm"]
+
+
+def measure(code, repeat):
+    # wall time of a fresh interpreter running code, best of repeat runs
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def loaded_heavy_modules(code):
+    probe = f"{code}\nimport sys, json\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=REPO_DIR, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def startup_benchmark(budget=0.3, repeat=5, output=None):
+    """
+        Import time of each entry point above a bare interpreter, fails (exit 1) when one exceeds
+        budget seconds or imports any of HEAVY_MODULES.
+        output: optional JSON file for the results
+    """
+    baseline = measure("pass", repeat)
+    results = {"budget": budget, "baseline": baseline, "entry_points": {}}
+    failed = False
+    for name, code in ENTRY_POINTS.items():
+        import_time = measure(code, repeat) - baseline
+        heavy = loaded_heavy_modules(code)
+        ok = import_time <= budget and not heavy
+        failed |= not ok
+        results["entry_points"][name] = {"import_time": import_time, "heavy_modules": heavy, "ok": ok}
+        print(f"{name:<12} {import_time*1000:8.1f} ms  {'OK' if ok else 'OVER BUDGET'}  {', '.join(heavy)}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    fire.Fire(startup_benchmark)
@@ -0,0 +1,74 @@
+import os
+import fire
+import contextlib
+from functools import partial
+
+from simulation import iter_games, write_game
+from benchmark import render_game, bench_file, write_benchmark
+from utils.GameStore import GameStoreWriter
+from utils import profiling
+
+
+def pipeline(bench_name, bench_size, strong_team_strength, weak_team_strength, ratio, anonymous, steps, player_stats,
+             seed=None, workers=1, save_dir=None, output_format="json", compress=False, token_budget=None,
+             shared_prefix=False, calibrate=True, profile=False, profile_pstats=False):
+    """
+        Simulate games and write their benchmark in one pass, without the game files in between.
+        Every worker renders the instances of the games it simulates, the file is the same for any number of workers
+        and holds the same instances as simulation.py followed by benchmark.py with the same parameters and seed,
+        in game id order.
+        The benchmark is saved as "benchmarks/{bench_name}_{bench_size}_{ratio}..." with the suffixes of benchmark.py.
+        save_dir: optional folder for the raw games, in output_format "json" or "store"
+        Other options are those of simulation.py and benchmark.py.
+        Unlike simulation.py a run does not resume: after a failure delete save_dir before running it again
+        (the benchmark file is only created once complete).
+    """
+    if output_format not in ["json", "store"]:
+        raise ValueError(f"Invalid output_format: {output_format}")
+    bench_name, save_file = bench_file(f"{bench_name}_{bench_size}_{ratio}", steps, player_stats, token_budget,
+                                       compress, shared_prefix)
+    if os.path.exists(save_file):
+        print(f"File {save_file} already exists.")
+        return
+    if save_dir is not None and os.path.exists(save_dir) and len(os.listdir(save_dir)) > 0:
+        print(f"Folder {save_dir} already exists and is not empty.")
+        return
+    os.makedirs("benchmarks", exist_ok=True)
+
+    render = partial(render_game, steps=steps, player_stats=player_stats, token_budget=token_budget,
+                     shared_prefix=shared_prefix, keep_game=save_dir is not None)
+    store_context = contextlib.nullcontext()
+    if save_dir is not None:
+        os.makedirs(save_dir, exist_ok=True)
+        if output_format == "store":
+            store_context = GameStoreWriter(save_dir)
+
+    def instances(games, store):
+        for game_name, (game, game_instances) in games:
+            if game is not None:
+                with profiling.stage("write_game"):
+                    if store is not None:
+                        store.add(game_name, game)
+                    else:
+                        write_game(save_dir, int(game_name.split("_")[-1]), game)
+            yield from game_instances
+
+    profile_context = contextlib.nullcontext()
+    if profile:
+        profile_context = profiling.profile_run(os.path.join("benchmarks", f"{bench_name}.profile.json"), pstats=profile_pstats)
+    with profile_context, store_context as store:
+        games = iter_games(bench_size, strong_team_strength, weak_team_strength, ratio, anonymous, seed=seed,
+                           workers=workers, calibrate=calibrate, render=render)
+        try:
+            total = write_benchmark(instances(games, store), save_file, shared_prefix)
+        except BaseException:
+            if save_dir is not None:
+                print(f"Pipeline failed, delete {save_dir} before running it again.")
+            raise
+    print(f"Simulate {bench_size} games, {total} instances\nSave to {save_file}")
+    if save_dir is not None:
+        print(f"Games saved to {save_dir}")
+    return
+
+if __name__ == "__main__":
+    fire.Fire(pipeline)
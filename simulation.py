@@ -1,39 +1,255 @@
-
 import os
 import json
-import fire
+import time
+import random
+import contextlib
 
-from tqdm import tqdm
+from glob import glob
+from functools import partial
+from multiprocessing import Pool
 
 from utils.NBAPlayer import select_team_players, load_team_profile
-from utils.GameGenerator import simulate_single_game, RATIO2ALPHA
+from utils.GameGenerator import simulate_single_game, game_seed, RATIO2ALPHA
+from utils.GameModel import GameModel
 from utils.stats import games_statistics, is_number
+from utils.GameStore import GameStore, GameStoreWriter, is_game_store
+from utils import profiling
+
+MANIFEST_DIR = ".sportsgen"
+MANIFEST_FILE = "manifest.jsonl"
+PROFILE_FILE = "profile.json"
+
+def simulate_game(game_id, seed, strong_team_strength, weak_team_strength, alpha, anonymous):
+    # every game owns its generator, the output does not depend on the worker running it
+    rng = random.Random(game_seed(seed, game_id))
+    with profiling.stage("select_players"):
+        match_teams_obj = select_team_players(strong_team_strength, weak_team_strength, anonymous=anonymous, rng=rng)
+        match_compare_scores, match_player_dict = load_team_profile(match_teams_obj)
+    simulation = simulate_single_game(match_compare_scores, match_player_dict, alpha=alpha, model=GameModel.load(), rng=rng)
+    return game_id, simulation
+
+def game_job(game_id, render=None, **kwargs):
+    """
+        Simulate one game in a worker, returns (game_id, result, measurements of the worker or None).
+        result is the game, or render(game_name, game) computed in the worker.
+    """
+    with profiling.stage("simulate_game"):
+        game_id, simulation = simulate_game(game_id, **kwargs)
+    result = simulation if render is None else render(f"game_{game_id}", simulation)
+    # measurements of the worker are sent back with the game and merged by the parent
+    return game_id, result, profiling.collect(reset_after=True) if profiling.enabled else None
+
+def map_games(game_ids, workers=1, ordered=True, **job_kwargs):
+    """
+        Yield (game_id, result) of game_job for game_ids, in that order unless ordered is False.
+    """
+    job = partial(game_job, **job_kwargs)
+    # forked workers start with empty measurements, the parent keeps its own
+    pool_context = Pool(workers, initializer=profiling.reset) if workers > 1 else contextlib.nullcontext()
+    with pool_context as pool:
+        if pool is None:
+            results = map(job, game_ids)
+        elif ordered:
+            results = pool.imap(job, game_ids, chunksize=8)
+        else:
+            results = pool.imap_unordered(job, game_ids, chunksize=8)
+        for game_id, result, worker_profile in results:
+            if worker_profile is not None:
+                profiling.merge(worker_profile)
+            yield game_id, result
 
-def create_new_games(bench_name, bench_size, strong_team_strength, weak_team_strength, ratio, anonymous):
-    save_dir = f"simulations/{bench_name}_{bench_size}_{ratio}"
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir, exist_ok=True)
-    elif os.path.exists(save_dir) and len(os.listdir(save_dir)) > 0:
+def is_calibrated(ratio, calibrate=True):
+    # whether the alpha of ratio comes from calibration: "1:x" ratios missing from RATIO2ALPHA, every "1:x"
+    # ratio unless calibrate is False, never a table entry like "real" that is not an S:NS ratio
+    if is_number(ratio):
+        return False
+    if ratio in RATIO2ALPHA:
+        return calibrate and str(ratio).startswith("1:")
+    return True
+
+def resolve_alpha(ratio, strong_team_strength, weak_team_strength, calibrate=True):
+    """
+        alpha of a ratio: a calibrated one for "1:x" ratios, the hand-tuned RATIO2ALPHA value for "real", for
+        the ratios of the table with calibrate=False or when they are out of reach, or the ratio itself when it is a number.
+    """
+    if not is_calibrated(ratio, calibrate):
+        return RATIO2ALPHA[ratio] if ratio in RATIO2ALPHA else ratio
+    from utils.calibration import calibrate_alpha
+    try:
+        alpha = calibrate_alpha(ratio, strong_team_strength=strong_team_strength, weak_team_strength=weak_team_strength)[0]
+    except ValueError as e:
+        if ratio not in RATIO2ALPHA:
+            raise
+        # e.g. "1:2", below the sparsest games the model simulates
+        print(f"{e}, using the hand-tuned alpha {RATIO2ALPHA[ratio]} of {ratio}")
+        return RATIO2ALPHA[ratio]
+    print(f"Calibrated alpha for {ratio}: {alpha}")
+    return alpha
+
+def load_model():
+    # load the compiled game model once, forked workers inherit it
+    with profiling.stage("load_model"):
+        model = GameModel.load()
+        model.turn_sampler.warm()
+    return model
+
+def iter_games(bench_size, strong_team_strength, weak_team_strength, ratio, anonymous, seed=None, workers=1,
+               calibrate=True, render=None):
+    """
+        Yield (game_name, game) for the games of a run in id order, without writing them to disk.
+        Game i is the same as game_{i}.json of create_new_games with the same parameters and seed.
+        seed: master seed, defaults to the current time (printed)
+        render: picklable function of (game_name, game) run in the worker processes right after the simulation,
+                its result is yielded in place of the game
+    """
+    alpha = resolve_alpha(ratio, strong_team_strength, weak_team_strength, calibrate)
+    if seed is None:
+        seed = int(time.time())
+        print(f"Master seed: {seed}")
+    load_model()
+    results = map_games(range(bench_size), workers, render=render, seed=seed, strong_team_strength=strong_team_strength,
+                        weak_team_strength=weak_team_strength, alpha=alpha, anonymous=anonymous)
+    for game_id, result in results:
+        yield f"game_{game_id}", result
+
+def load_manifest(manifest_path):
+    """
+        Returns (header, {game_id: entry}) of a run manifest, (None, {}) when there is none.
+        A torn last line of a crashed run is ignored.
+    """
+    header, games = None, {}
+    if not os.path.exists(manifest_path):
+        return header, games
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "params" in entry:
+                header = entry
+            else:
+                games[entry["game_id"]] = entry
+    return header, games
+
+def saved_games(save_dir, output_format):
+    # ids of the games complete on disk, temporary files are never matched
+    if output_format == "store":
+        if not is_game_store(save_dir):
+            return set()
+        names = GameStore(save_dir).index
+    else:
+        names = [os.path.basename(fpath).split(".")[0] for fpath in glob(os.path.join(save_dir, "game_*.json"))]
+    return {int(name.split("_")[-1]) for name in names}
+
+def write_game(save_dir, game_id, simulation):
+    # write-then-rename, a partially written game is never visible as game_{id}.json
+    fpath = os.path.join(save_dir, f"game_{game_id}.json")
+    tmp_path = os.path.join(save_dir, f".game_{game_id}.json.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(simulation, indent=4))
+    os.replace(tmp_path, fpath)
+    return os.path.basename(fpath)
+
+def create_new_games(bench_name, bench_size, strong_team_strength, weak_team_strength, ratio, anonymous, seed=None, workers=1,
+                     output_format="json", save_dir=None, profile=False, profile_pstats=False, calibrate=True):
+    """
+        ratio: "1:x" (alpha calibrated with utils/calibration.py, e.g. "1:2" ... "1:5" as in the paper), "real"
+               or a float alpha
+        calibrate: False to use the hand-tuned RATIO2ALPHA alphas of "1:2" ... "1:5", as the released
+                   benchmarks were generated, their S:NS ratios are only close to the labels
+        seed: master seed of the run, game i is generated from (seed, i). Defaults to the current time.
+        workers: number of processes generating games, the output is identical for any value.
+        output_format: "json" for one game_{id}.json per game, "store" for a columnar game store (utils/GameStore.py)
+        save_dir: output folder, defaults to "simulations/{bench_name}_{bench_size}_{ratio}"
+        profile: save stage timings and counters to {save_dir}/.sportsgen/profile.json
+        profile_pstats: with profile, also dump cProfile stats of the main process next to it
+
+        Every run keeps a manifest in {save_dir}/.sportsgen/manifest.jsonl (parameters, model hash, seed and
+        status of each game). Rerunning the same command resumes an interrupted run, and rerunning with a larger
+        bench_size and the same save_dir appends games to it.
+    """
+    from tqdm import tqdm
+    if output_format not in ["json", "store"]:
+        raise ValueError(f"Invalid output_format: {output_format}")
+    if save_dir is None:
+        save_dir = f"simulations/{bench_name}_{bench_size}_{ratio}"
+    manifest_path = os.path.join(save_dir, MANIFEST_DIR, MANIFEST_FILE)
+    header, manifest_games = load_manifest(manifest_path)
+    if header is None and os.path.exists(save_dir) and len(os.listdir(save_dir)) > 0:
         print(f"Folder {save_dir} already exists and is not empty.")
         return
-    
+
     # load density ratio
-    if ratio not in RATIO2ALPHA and is_number(ratio):
-        alpha = ratio
-    elif ratio in RATIO2ALPHA:
-        alpha = RATIO2ALPHA[ratio]
+    calibrated = is_calibrated(ratio, calibrate)
+    if header is not None and header["params"]["ratio"] == ratio and header["params"].get("calibrated", False) == calibrated:
+        # a resumed run keeps its alpha, even if the calibration curve was refined since
+        alpha = header["params"]["alpha"]
     else:
-        raise ValueError(f"Invalid ratio: {ratio}")
-    
-    for game_id in tqdm(range(bench_size)):
-        match_teams_obj = select_team_players(strong_team_strength, weak_team_strength, anonymous=anonymous)
-        match_compare_scores, match_player_dict = load_team_profile(match_teams_obj)
-        simulation = simulate_single_game(match_compare_scores, match_player_dict, alpha=alpha)
-        with open(os.path.join(save_dir, f"game_{game_id}.json"), 'w') as f:
-            f.write(json.dumps(simulation, indent=4))
-    print(f"Game Simulation Completed: save to {save_dir}")
-    games_statistics(save_dir)
+        alpha = resolve_alpha(ratio, strong_team_strength, weak_team_strength, calibrate)
+
+    # near-zero overhead unless profiling: hot paths only check profiling.enabled
+    profile_context = contextlib.nullcontext()
+    if profile:
+        os.makedirs(os.path.join(save_dir, MANIFEST_DIR), exist_ok=True)
+        profile_context = profiling.profile_run(os.path.join(save_dir, MANIFEST_DIR, PROFILE_FILE), pstats=profile_pstats)
+    with profile_context:
+        model = load_model()
+        params = {"strong_team_strength": strong_team_strength, "weak_team_strength": weak_team_strength,
+                  "ratio": ratio, "alpha": alpha, "anonymous": anonymous, "output_format": output_format}
+        if calibrated:
+            params["calibrated"] = True
+        if header is not None:
+            if seed is None:
+                seed = header["seed"]
+            previous = dict(header["params"], seed=header["seed"], model_hash=header["model_hash"])
+            current = dict(params, seed=seed, model_hash=model.source_hash)
+            changed = [k for k in current if previous.get(k) != current[k]]
+            if changed:
+                raise ValueError(f"Cannot resume {save_dir}, different {', '.join(changed)}: {previous} vs {current}")
+        elif seed is None:
+            seed = int(time.time())
+        print(f"Master seed: {seed}")
+
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        manifest = open(manifest_path, 'a')
+        if header is None:
+            manifest.write(json.dumps({"params": params, "seed": seed, "model_hash": model.source_hash}) + "\n")
+
+        def record(game_id, location):
+            manifest.write(json.dumps({"game_id": game_id, "seed": game_seed(seed, game_id), "location": location,
+                                       "status": "done"}) + "\n")
+            manifest.flush()
+
+        # games on disk are complete, record the ones a crash kept out of the manifest
+        done = saved_games(save_dir, output_format)
+        for game_id in sorted(done - set(manifest_games)):
+            record(game_id, "recovered")
+        todo = [game_id for game_id in range(bench_size) if game_id not in done]
+        if len(done) > 0:
+            print(f"Resume {save_dir}: {len(done)} games done, {len(todo)} to generate")
+
+        games = map_games(todo, workers, ordered=output_format == "store", seed=seed, strong_team_strength=strong_team_strength,
+                          weak_team_strength=weak_team_strength, alpha=alpha, anonymous=anonymous)
+        if output_format == "store":
+            def record_shard(shard, names):
+                for name in names:
+                    record(int(name.split("_")[-1]), shard)
+            # in order, so the shards do not depend on the number of workers
+            with GameStoreWriter(save_dir, on_flush=record_shard) as writer:
+                for game_id, simulation in tqdm(games, total=len(todo)):
+                    with profiling.stage("write"):
+                        writer.add(f"game_{game_id}", simulation)
+        else:
+            for game_id, simulation in tqdm(games, total=len(todo)):
+                with profiling.stage("write"):
+                    record(game_id, write_game(save_dir, game_id, simulation))
+        manifest.close()
+        print(f"Game Simulation Completed: save to {save_dir}")
+        with profiling.stage("statistics"):
+            games_statistics(save_dir, workers=workers)
     return
-    
+
 if __name__ == "__main__":
-    fire.Fire(create_new_games)
\ No newline at end of file
+    import fire
+    fire.Fire(create_new_games)
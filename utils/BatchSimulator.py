@@ -0,0 +1,300 @@
+import gc
+
+import numpy as np
+
+from utils.GameModel import GameModel
+from utils.GameGenerator import play_count_table, make_probability, CLOCK_TEXT, summarize_game, quarter_start, MAKE_ONCE_PROB, QUARTER_SECONDS
+from utils.alias import sample_alias
+
+MAX_TURNS = 200 # same cap as generate_game
+# turn conditions drawn per turn: (makes, require_miss), make once / make twice / miss
+CONDITIONS = [(1, False), (2, False), (0, True)]
+RANDOM_SLOT = -2 # slot plan entry of a slot filled by a random player of the team, -1 is the team name
+
+_tables_cache = {}
+
+
+class BatchTables:
+    """
+        Array form of a GameModel: everything the lockstep simulator samples from, indexed by state id.
+    """
+    def __init__(self, model):
+        sampler = model.turn_sampler
+        self.state_events = sampler.state_events
+        n = len(self.state_events)
+        self.start_states = np.array([sampler.start_states["start"], sampler.start_states["vs"]])
+        self.successors = sampler.successors
+        self.is_make = sampler.is_make
+        self.is_miss = sampler.is_miss
+        # alias tables of the conditioned walk (over successors) and of the turn length, [condition, ...]
+        self.step_prob = np.stack([sampler.step_alias(*c)[0] for c in CONDITIONS])
+        self.step_alias = np.stack([sampler.step_alias(*c)[1] for c in CONDITIONS])
+        length_tables = [[sampler.step_alias(*c)[4][start] for start in ["start", "vs"]] for c in CONDITIONS]
+        self.length_prob = np.array([[t.prob for t in row] for row in length_tables])
+        self.length_alias = np.array([[t.alias for t in row] for row in length_tables])
+        self.length_weights = np.array([[sampler.length_weights(*c, start=start) for start in ["start", "vs"]] for c in CONDITIONS])
+        self.feasible = self.length_weights > 0
+
+        # compiled templates per state, "free throw" template used inside and-one / free throw sequences
+        self.templates = [model.templates.get(event, []) for event in self.state_events]
+        self.template_count = np.array([max(len(t), 1) for t in self.templates])
+        self.free_throw_index = np.array([-1 if model.free_throw_index.get(event) is None else model.free_throw_index[event]
+                                          for event in self.state_events])
+        # templates of all states in one flat list, states without templates keep one empty entry so that
+        # template_offset[v] + template id is always a valid flat id
+        flat = [template for t in self.templates for template in (t or [None])]
+        self.template_offset = np.concatenate([[0], np.cumsum(self.template_count)[:-1]])
+        self.flat_templates = flat
+        self.formats = [None if t is None else "".join(part.replace("{", "{{").replace("}", "}}") if i % 2 == 0 else f"{{{part}}}"
+                                                        for i, part in enumerate(t.parts)) for t in flat]
+        self.num_slots = [0 if t is None else len(t.slots) for t in flat]
+        self.max_slots = max(max(self.num_slots), 1)
+        self.actor = np.array([-1 if t is None or t.actor is None else t.actor for t in flat])
+        self.assist = np.array([-1 if t is None or t.assist is None else t.assist for t in flat])
+        self.points = np.array([0 if t is None else t.points for t in flat])
+
+        # duration alias tables padded to the longest one, events without durations ("start", "end") take 0 seconds
+        width = max(t.n for t in model.duration_tables.values())
+        self.duration_values = np.zeros((n, width), dtype=int)
+        self.duration_prob = np.ones((n, width))
+        self.duration_alias = np.zeros((n, width), dtype=np.int64)
+        self.duration_size = np.ones(n, dtype=np.int64)
+        for v, event in enumerate(self.state_events):
+            if event not in model.duration_tables:
+                continue
+            table = model.duration_tables[event]
+            self.duration_values[v, :table.n] = table.values
+            self.duration_prob[v, :table.n] = table.prob
+            self.duration_alias[v, :table.n] = table.alias
+            self.duration_size[v] = table.n
+
+    @classmethod
+    def for_model(cls, model):
+        if id(model) not in _tables_cache:
+            _tables_cache[id(model)] = cls(model)
+        return _tables_cache[id(model)]
+
+
+def sample_turns(tables, cond, num_plays, start, np_rng):
+    """
+        Walk k conditioned turns at once, returns (events (k, width) with -1 padding, path lengths).
+        start: 0 for a regular turn, 1 to open with "vs" (kept in the path as generate_turn does)
+    """
+    k = len(cond)
+    u = np.full(k, tables.start_states[start])
+    m = np.zeros(k, dtype=int)
+    s = np.zeros(k, dtype=int)
+    r = num_plays.copy()
+    events = np.full((k, num_plays.max() + start), -1)
+    if start:
+        events[:, 0] = u
+    for t in range(num_plays.max()):
+        live = np.flatnonzero(r > 0)
+        row = (cond[live], r[live], m[live], s[live], u[live])
+        v = tables.successors[u[live], sample_alias(tables.step_prob[row], tables.step_alias[row], np_rng)]
+        events[live, t + start] = v
+        u[live] = v
+        m[live] = np.minimum(m[live] + tables.is_make[v], 2)
+        s[live] |= tables.is_miss[v]
+        r[live] -= 1
+    return events, num_plays + start
+
+
+def simulate_quarter_batch(tables, quarter_id, p_make, play_table, np_rng):
+    """
+        Advance every game of the batch through one quarter, turn by turn in lockstep.
+        Returns the list of turn records (turn id, game ids, events, template ids, clock, emitted, ended).
+    """
+    n = len(p_make)
+    start = 0 if quarter_id > 0 else 1
+    clock = np.full(n, QUARTER_SECONDS)
+    active = np.ones(n, dtype=bool)
+    records = []
+    for i in range(MAX_TURNS):
+        games = np.flatnonzero(active)
+        k = len(games)
+        if k == 0:
+            break
+        team_id = i % 2
+        num_plays = play_table.sample_many(np_rng, k)
+        make = np_rng.random(k) < p_make[games, team_id]
+        cond = np.where(make, np.where(np_rng.random(k) < MAKE_ONCE_PROB, 0, 1), 2)
+        # a make turn keeps its number of makes at any length, or takes the other one at num_plays events,
+        # in proportion to their probability as in TurnSampler.sample_make
+        any_length = tables.length_weights[cond, start].sum(axis=1)
+        at_length = np.where(make, tables.length_weights[1 - np.minimum(cond, 1), start, num_plays], 0)
+        free_length = make & (np_rng.random(k) * (any_length + at_length) < any_length)
+        cond = np.where(make & ~free_length, 1 - np.minimum(cond, 1), cond)
+        if free_length.any():
+            row = (cond[free_length], start)
+            num_plays[free_length] = sample_alias(tables.length_prob[row], tables.length_alias[row], np_rng)
+        # conditions without any turn of the requested length fall back to drawing the length
+        infeasible = np.flatnonzero(~tables.feasible[cond, start, num_plays])
+        if len(infeasible):
+            row = (cond[infeasible], start)
+            num_plays[infeasible] = sample_alias(tables.length_prob[row], tables.length_alias[row], np_rng)
+        events, path_len = sample_turns(tables, cond, num_plays, start, np_rng)
+
+        width = events.shape[1]
+        valid = np.arange(width) < path_len[:, None]
+        safe_events = np.where(valid, events, 0)
+
+        # game clock
+        flat = safe_events.ravel()
+        dur_idx = sample_alias(tables.duration_prob[flat], tables.duration_alias[flat], np_rng, tables.duration_size[flat])
+        durations = tables.duration_values[flat, dur_idx].reshape(k, width) * valid
+        times = clock[games, None] - np.cumsum(durations, axis=1)
+        cut = valid & (times < 0)
+        ended = cut.any(axis=1)
+        emitted = np.where(ended, cut.argmax(axis=1), path_len)
+
+        # templates, free throw wording from the first make-make pair to the end of the turn
+        template_ids = (np_rng.random((k, width)) * tables.template_count[safe_events]).astype(int)
+        pair = np.zeros((k, width), dtype=bool)
+        pair[:, :-1] = tables.is_make[safe_events[:, :-1]] & tables.is_make[safe_events[:, 1:]] & valid[:, 1:]
+        free_throw = np.logical_or.accumulate(pair, axis=1) & (tables.free_throw_index[safe_events] >= 0)
+        template_ids = np.where(free_throw, tables.free_throw_index[safe_events], template_ids)
+
+        records.append((team_id, games, events, template_ids, times, emitted, ended))
+        keep = ~ended
+        clock[games[keep]] = times[keep, emitted[keep] - 1]
+        active[games[ended]] = False
+    return records
+
+
+def slot_plans(tables, players):
+    """
+        Slot filling of every flat template for the player lists of the batch.
+        Returns (layout, plans, sizes, names): layout[g, team] indexes the distinct position lists,
+        plans[layout, template] the player index of every slot (-1 team name, RANDOM_SLOT random player),
+        sizes[layout] the number of players and names[2 * g + team] the player names, the team name last.
+    """
+    team_name = ['team1', 'team2']
+    layout_ids, position_lists = {}, []
+    layout = np.zeros((len(players), 2), dtype=np.int64)
+    width = max(len(players_dict[team]) for players_dict in players for team in team_name) + 1
+    names = np.full((2 * len(players), width), None, dtype=object)
+    for g, players_dict in enumerate(players):
+        for team_id, team in enumerate(team_name):
+            positions = tuple(players_dict[team].keys())
+            if positions not in layout_ids:
+                layout_ids[positions] = len(position_lists)
+                position_lists.append(positions)
+            layout[g, team_id] = layout_ids[positions]
+            names[2 * g + team_id, :len(positions)] = [player['name'] for player in players_dict[team].values()]
+            names[2 * g + team_id, -1] = team
+    plans = np.full((len(position_lists), len(tables.flat_templates), tables.max_slots), RANDOM_SLOT)
+    for l, positions in enumerate(position_lists):
+        for tid, template in enumerate(tables.flat_templates):
+            for j, (kind, pos) in enumerate(template.slots if template is not None else []):
+                if kind == "team":
+                    plans[l, tid, j] = -1
+                elif kind == "position" and pos in positions:
+                    plans[l, tid, j] = positions.index(pos)
+    sizes = np.array([len(positions) for positions in position_lists])
+    return layout, plans, sizes, names
+
+
+def emit_quarter(tables, quarter_id, records, plans, np_rng):
+    """
+        Turn the array records of one quarter into the play dicts of generate_game. The plays of all games
+        are gathered into flat arrays and the random slot players of the quarter are drawn in one block,
+        only the formatting of the descriptions and the dicts are built per play.
+    """
+    layout, slot_plan, sizes, names = plans
+    n = len(layout)
+    team_name = ['team1', 'team2']
+    # flat plays in turn order: game, team, flat template (-1 marks the end of the quarter), clock, scoring
+    game_ids, team_ids, template_ids, times, scoring = [], [], [], [], []
+    for team_id, games, events, turn_templates, turn_times, emitted, ended in records:
+        width = events.shape[1]
+        pos = np.arange(width + 1)
+        emit = (pos < emitted[:, None]) | ((pos == emitted[:, None]) & ended[:, None])
+        rows, cols = np.nonzero(emit)
+        is_play = cols < emitted[rows]
+        cols = np.minimum(cols, width - 1)
+        play_events = np.maximum(events[rows, cols], 0)
+        flat_ids = tables.template_offset[play_events] + turn_templates[rows, cols]
+        game_ids.append(games[rows])
+        team_ids.append(np.full(len(rows), team_id))
+        template_ids.append(np.where(is_play, flat_ids, -1))
+        times.append(turn_times[rows, cols])
+        scoring.append(tables.is_make[play_events])
+    order = np.argsort(np.concatenate(game_ids), kind="stable")
+    game_ids, team_ids, template_ids, times, scoring = (np.concatenate(c)[order] for c in [game_ids, team_ids, template_ids, times, scoring])
+
+    play_layout = layout[game_ids, team_ids]
+    draws = (np_rng.random((len(game_ids), tables.max_slots)) * sizes[play_layout][:, None]).astype(np.int64)
+    slots = slot_plan[play_layout, template_ids]
+    slots = np.where(slots == RANDOM_SLOT, draws, slots)
+    rows = np.arange(len(slots))
+    actor, assist = tables.actor[template_ids], tables.assist[template_ids]
+    # None for team slots and missing roles, as fill_players and roles return them
+    player = np.where(actor >= 0, slots[rows, actor], -1).astype(object)
+    player[actor < 0] = None
+    assistant = np.where(assist >= 0, slots[rows, assist], -1).astype(object)
+    assistant[assist < 0] = None
+    slot_players = slots.astype(object)
+    slot_players[slots < 0] = None
+    # slot -1 wraps around to the team name, str.format ignores the names past the template's slots
+    fill_names = names[(2 * game_ids + team_ids)[:, None], slots % names.shape[1]]
+    time_texts = np.array(CLOCK_TEXT, dtype=object)[np.clip(times, 0, QUARTER_SECONDS)]
+    points = tables.points[template_ids]
+
+    quarters = [[quarter_start(quarter_id)] for _ in range(n)]
+    formats, num_slots = tables.formats, tables.num_slots
+    for g, team_id, tid, clock, score, pts, fill_name, fill, p, a in zip(
+            game_ids.tolist(), team_ids.tolist(), template_ids.tolist(), time_texts.tolist(), scoring.astype(bool).tolist(),
+            points.tolist(), fill_names.tolist(), slot_players.tolist(), player.tolist(), assistant.tolist()):
+        if tid < 0:
+            quarters[g].append({"team": None, "time": "0:0", "description": "end of quarter", "ScoringPlay": False,
+                                "points": 0, "player": None, "assist": None, "slots": []})
+            continue
+        quarters[g].append({
+            "team": team_name[team_id],
+            "time": clock,
+            "description": formats[tid].format(*fill_name),
+            "ScoringPlay": score,
+            "points": pts,
+            "player": p,
+            "assist": a,
+            "slots": fill[:num_slots[tid]],
+        })
+    return quarters
+
+
+def simulate_games_batch(n, power_lists, players, alpha=0.5, model=None, seed=None):
+    """
+        Simulate n games in lockstep with NumPy, same output format as simulate_single_game.
+        power_lists: [strong, weak] team power per game, or one pair shared by all games
+        players: players_dict ({"team1": {pos: player}, "team2": ...}) per game, or one shared dict
+        alpha: density of the play count distribution
+        seed: seed of the batch, all random numbers are drawn in blocks from one generator
+    """
+    if model is None:
+        model = GameModel.load()
+    tables = BatchTables.for_model(model)
+    np_rng = np.random.default_rng(seed)
+
+    powers = np.array(power_lists, dtype=float)
+    if powers.ndim == 1:
+        powers = np.broadcast_to(powers, (n, 2))
+    if isinstance(players, dict):
+        players = [players] * n
+    p_make = make_probability(powers)
+    plans = slot_plans(tables, players)
+    play_table = play_count_table(alpha)
+
+    pbp = [[] for _ in range(n)]
+    # the play dicts hold no reference cycles, collections while they are built would only walk the growing heap
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for qid in range(4):
+            records = simulate_quarter_batch(tables, qid, p_make, play_table, np_rng)
+            for g, quarter in enumerate(emit_quarter(tables, qid, records, plans, np_rng)):
+                pbp[g].append(quarter)
+        return [summarize_game(pbp[g], players[g]) for g in range(n)]
+    finally:
+        if gc_enabled:
+            gc.enable()
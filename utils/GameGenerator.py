@@ -3,25 +3,27 @@ import os
 import re
 import json
 import math
-import yaml
 import time
-import pickle
 import random
 
-import scipy.stats as stats
-import networkx as nx
+import numpy as np
 
-from openai import OpenAI
+from utils.GameModel import GameModel, load_pickle, load_json, build_tree_with_probabilities, duration_distribution
+from utils.TurnSampler import InfeasibleTurnError
+from utils.llm import parse_points_llm
+from utils.alias import AliasTable
+from utils import profiling
 
 current_directory = os.getcwd()
-# initial openai client
-config = yaml.safe_load(open("config/openai_key.yaml"))
-client = OpenAI(api_key=config["api-key"])
-DEFAULT_ENGINE = "gpt-4o-mini"
-PARAMETERS = config['parameters']
 random.seed(42)
 
 
+MAKE_ONCE_PROB = 0.75 # a "make" turn has one make w.p. 0.75, two otherwise
+QUARTER_SECONDS = 12 * 60
+
+_play_count_tables = {}
+
+
 RATIO2ALPHA = {
     "1:2": -0.3,
     "1:3": 0,
@@ -30,50 +32,7 @@ RATIO2ALPHA = {
     "1:4": 0.5,
 }
 
-def openai_request(**kwargs):
-    try:
-        response = client.chat.completions.create(**kwargs)
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
-    return response
-
-def load_pickle(file_path):
-    with open(file_path, 'rb') as file:
-        var = pickle.load(file)
-    return var
-
-def load_json(file_path):
-    with open(file_path, 'r') as file:
-        var = json.load(file)
-    return var
-
-# Define a function to build a directed graph from a list of event sequences
-def build_tree_with_probabilities(paths):
-    G = nx.DiGraph()
-    edge_counts = {}
-    
-    for path in paths:
-        for i in range(len(path) - 1):
-            edge = (path[i], path[i + 1])
-            if edge not in edge_counts:
-                edge_counts[edge] = 0
-            edge_counts[edge] += 1
-
-    node_counts = {}
-    for (u, v), count in edge_counts.items():
-        if u not in node_counts:
-            node_counts[u] = 0
-        node_counts[u] += count
-    
-    for (u, v), count in edge_counts.items():
-        probability = count / node_counts[u]
-        G.add_edge(u, v, weight=probability)
-    
-    return G
-
-
-def random_choice_with_prob(candidates, prob_list=False, key_word=False):
+def random_choice_with_prob(candidates, prob_list=False, key_word=False, rng=random):
     # prob_list default to be uniform distribution
     if not prob_list:
         prob_list = [1/len(candidates)]*len(candidates)
@@ -81,16 +40,20 @@ def random_choice_with_prob(candidates, prob_list=False, key_word=False):
         for i in range(len(candidates)):
             if key_word in candidates[i]:
                 return candidates[i]
-    return random.choices(candidates, prob_list)[0]
+    return rng.choices(candidates, prob_list)[0]
 
-def make_or_miss(prob):
+def make_probability(prob):
+    # average of highest team attack FG% 50.7, 3P% 37.9%, FT% 85.9%
+    return (prob / 100) * (0.58-0.36) + 0.36
+
+def make_or_miss(prob, rng=random):
     """
         Given team's overall score[0-100], return "make" or "miss" event
     """
-    prob = (prob / 100) * (0.58-0.36) + 0.36 # average of highest team attack FG% 50.7, 3P% 37.9%, FT% 85.9%
-    return random.choices(["make", "miss"], [prob, 1-prob])[0]
+    prob = make_probability(prob)
+    return "make" if rng.random() < prob else "miss"
 
-def modify_num_play_each_turn(density):
+def modify_num_play_each_turn(density, rng=random):
     """
         adjust gaussian distribution to generate number of plays in each turn
         original distribution: mean = 1.65, std = 0.92
@@ -98,19 +61,29 @@ def modify_num_play_each_turn(density):
         mean = 1.65*(1 +  2 * density), std = 0.92
         output: number of plays for this turn
     """
+    num_play = play_count_table(density).sample(rng)
+    return num_play
+
+def play_count_table(density):
+    # alias table of play_count_distribution, built once per density
+    if density not in _play_count_tables:
+        _play_count_tables[density] = AliasTable(*play_count_distribution(density))
+    return _play_count_tables[density]
+
+def play_count_distribution(density):
+    # unnormalized probabilities of 1..10 plays in a turn
     mean = 1.65 * (1 + 2 * density)
     std = 0.92
-    distribution = stats.norm(mean, std)
-    prob_list=  [distribution.pdf(i) for i in range(1, 11)]
-    num_play = random_choice_with_prob(range(1, 11), prob_list)
-    return num_play
+    # gaussian pdf, written out instead of importing scipy.stats for it
+    prob_list=  [math.exp(-0.5 * ((i - mean) / std) ** 2) / (std * math.sqrt(2 * math.pi)) for i in range(1, 11)]
+    return range(1, 11), prob_list
 
 
 def num_ele_in_list(list, element):
     return len([ele for ele in list if ele == element])
 
 
-def generate_turn(tree, quarter_init=False):
+def generate_turn(tree, quarter_init=False, rng=random):
     # traverse from "stat" to "end" to generate a path
     end_node = "end"
     paths = []
@@ -120,17 +93,19 @@ def generate_turn(tree, quarter_init=False):
         cur_node = "vs"
         paths.append(cur_node)
 
-    # generate a path from start to end
+    # generate a path from start to end, counting the makes on the way
+    makes = 0
     while cur_node != end_node:
         next_node_list = [v for v in tree[cur_node].keys()]
-        if num_ele_in_list(paths, "make") == 2:
+        if makes == 2:
             # if two "make" events are consecutive, the next event should not be "make"
             next_node_probs = [tree[cur_node][v]['weight'] if v != "make" else 0 for v in next_node_list]
         else:
             next_node_probs = [tree[cur_node][v]['weight'] for v in next_node_list]
-        next_node = random.choices(next_node_list, next_node_probs)[0] # given possible children nodes and probabilities, randomly choose one
+        next_node = rng.choices(next_node_list, next_node_probs)[0] # given possible children nodes and probabilities, randomly choose one
         if next_node != end_node:
             paths.append(next_node)
+            makes += next_node == "make"
         cur_node = next_node
 
     return paths
@@ -157,41 +132,48 @@ def parse_points(text):
         return 2
     else:
         # print(text)
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": f"Calculate the points for this play description. \n\nExample 1:\nText: makes jump bank shot\nPoint: 2\n\nText: {text}\nPoints:"}
-        ]
-        PARAMETERS.update({"messages": messages, "model": DEFAULT_ENGINE})
-        response = openai_request(**PARAMETERS)
-        if response is not None:
-            return int(response.choices[0].message.content.lower())
+        # the LLM backend is created on first use, offline runs get 0 points
+        profiling.count("llm_point_fallbacks")
+        points = parse_points_llm([text])[0]
+        if points is not None:
+            return points
+        profiling.count("llm_point_failures")
         return 0 
 
-def conditional_turn_generator(graph, num_plays, key_event=False, quarter=False):   
-    number_of_make = random.choices([1,2],[0.75, 0.25])[0]
-    max_retry = 10000
-    while True:
-        path = generate_turn(graph, quarter_init=quarter)
-        # ! GPT-3.5 reject unreasonable path
-        if key_event == "miss":
-            if key_event not in path or "make" in path:
-                continue
-        elif key_event == "make":
-            if key_event not in path:
-                continue
-            elif num_ele_in_list(path, "make") == number_of_make:
-                # print(f"number of make: {num_ele_in_list(path, 'make')}, expected: {number_of_make}")
-                return path
-        if "vs" in path and len(path) - 1 == num_plays:
-            return path  
-        elif len(path) == num_plays:
-            return path
-        max_retry -= 1
-        if max_retry == 0:
-            return path # if reach the max retry, randomly return the path
-
-
-def path_template(path, verb_desc_dict):
+def conditional_turn_generator(sampler, num_plays, key_event=False, quarter=False, strict=False, rng=random):
+    """
+        Draw a turn that ends in key_event ("make" or "miss"), with the acceptance rule of the old rejection loop:
+        a "make" turn has 1 or 2 makes (0.75 / 0.25) at any length, or the other number of makes at exactly
+        num_plays events, a "miss" turn has no make, a miss and num_plays events, other turns num_plays events.
+        sampler: TurnSampler (GameModel.turn_sampler), the path is drawn exactly from the conditioned
+                 Markov chain, no third "make" in a turn as in generate_turn.
+        If no turn of length num_plays can satisfy the condition (e.g. a miss turn of one play from "vs") the
+        length condition is dropped as the old loop did after max_retry, counted in the "turns_relaxed"
+        profile counter. strict=True raises InfeasibleTurnError instead.
+    """
+    number_of_make = 1 if rng.random() < MAKE_ONCE_PROB else 2
+    if key_event == "make":
+        makes, require_miss = number_of_make, False
+    elif key_event == "miss":
+        makes, require_miss = 0, True
+    else:
+        makes, require_miss = None, False
+    start = "vs" if quarter else "start"
+    try:
+        if key_event == "make":
+            return sampler.sample_make(num_plays, makes, start=start, rng=rng)
+        return sampler.sample(num_plays, makes=makes, require_miss=require_miss, start=start, rng=rng)
+    except InfeasibleTurnError:
+        # no conforming path, counted as the old loop's max_retry fallback
+        profiling.count("turns_relaxed")
+        if strict:
+            raise
+        if not sampler.is_feasible(None, makes, require_miss, start):
+            makes, require_miss = None, False
+        return sampler.sample(None, makes=makes, require_miss=require_miss, start=start, rng=rng)
+
+
+def path_template(path, verb_desc_dict, rng=random):
     path_desc = []
     active_free_throw = False
     for pos,event in enumerate(path):
@@ -204,18 +186,36 @@ def path_template(path, verb_desc_dict):
         # check if two "make" events are consecutive
         if event == "make" and pos < len(path) - 1 and path[pos + 1] == "make":
             active_free_throw = True
-            path_desc.append(random_choice_with_prob(desc_candidates, key_word="free throw"))
+            path_desc.append(random_choice_with_prob(desc_candidates, key_word="free throw", rng=rng))
             continue
 
         if active_free_throw:
-            path_desc.append(random_choice_with_prob(desc_candidates, key_word="free throw"))
+            path_desc.append(random_choice_with_prob(desc_candidates, key_word="free throw", rng=rng))
             continue
 
         # other event
-        path_desc.append(random_choice_with_prob(desc_candidates))
+        path_desc.append(random_choice_with_prob(desc_candidates, rng=rng))
     return path_desc
 
 
+def path_template_ids(path, templates, free_throw_index, rng=random):
+    """
+        Same choice as path_template on compiled templates, returns one template index per event.
+        templates, free_throw_index: GameModel.templates, GameModel.free_throw_index
+    """
+    template_ids = []
+    active_free_throw = False
+    for pos,event in enumerate(path):
+        # check if two "make" events are consecutive
+        if event == "make" and pos < len(path) - 1 and path[pos + 1] == "make":
+            active_free_throw = True
+        if active_free_throw and free_throw_index[event] is not None:
+            template_ids.append(free_throw_index[event])
+        else:
+            template_ids.append(rng.randrange(len(templates[event])))
+    return template_ids
+
+
 def convert_time_to_seconds(timestamp):
     if ":" in timestamp:
         time = timestamp.split(":")
@@ -223,7 +223,7 @@ def convert_time_to_seconds(timestamp):
     else:
         return math.ceil(float(timestamp))
 
-def fill_in_players(text, team_name, player_name_dict):
+def fill_in_players(text, team_name, player_name_dict, rng=random):
     # find all content in <> and replace with player name
     player_name = re.findall(r'<(.*?)>', text)
     for name in player_name:
@@ -235,11 +235,11 @@ def fill_in_players(text, team_name, player_name_dict):
                 text = text.replace(f"<{name}>", player_name_dict[pos.upper()]['name'])
             else: # if 
                 pos_list = list(player_name_dict.keys())
-                random_pos = random.choice(pos_list)
+                random_pos = rng.choice(pos_list)
                 text = text.replace(f"<{name}>", player_name_dict[random_pos]['name'])
         else:
             pos_list = list(player_name_dict.keys())
-            random_pos = random.choice(pos_list)
+            random_pos = rng.choice(pos_list)
             text = text.replace(f"<{name}>", player_name_dict[random_pos]['name'])
     return text
 
@@ -250,124 +250,207 @@ def convert_seconds_to_time(seconds):
         sec = f"0{sec}"
     return f"{min}:{sec}"
 
-def get_timestamp(event_duration, path, start_time):
+# clock strings of a quarter, plays share them instead of formatting their own
+CLOCK_TEXT = [convert_seconds_to_time(seconds) for seconds in range(QUARTER_SECONDS + 1)]
+
+def clock_text(seconds):
+    if 0 <= seconds <= QUARTER_SECONDS:
+        return CLOCK_TEXT[seconds]
+    return convert_seconds_to_time(seconds)
+
+def get_timestamp_seconds(duration_tables, path, start_seconds, rng=random):
+    """
+        Game clock in seconds after each event of path, starting from start_seconds, cut where the quarter ends.
+        duration_tables: {event: AliasTable of durations}, GameModel.duration_tables
+    """
     time_stamps = []
-    start_seconds = convert_time_to_seconds(start_time)
     cur_time = start_seconds
     for event in path:
-        # return current time_stamps if cur_time < 0
-
-        if event not in event_duration.keys():
+        table = duration_tables.get(event)
+        if table is None:
             print(f"Event {event} not in event_duration")
-            time_stamps.append(convert_seconds_to_time(start_seconds))
+            time_stamps.append(start_seconds)
             continue
-        
-        # get duration list and prob
-        dur_list = []
-        prob_list = []
-        for k,v in event_duration[event].items():
-            if event not in ["make", "defensive goaltending violation"] and k == 0:
-                continue
-            dur_list.append(k)
-            prob_list.append(v)
-        duration = random_choice_with_prob(dur_list, prob_list)
-        cur_time -= duration
+
+        cur_time -= table.sample(rng)
 
         # if updated time is less the 0, means the quarter ends
         if cur_time < 0:
             return time_stamps
 
-        time_stamps.append(convert_seconds_to_time(cur_time))
+        time_stamps.append(cur_time)
     return time_stamps
 
+def get_timestamp(duration_tables, path, start_time, rng=random):
+    """
+        duration_tables: {event: AliasTable of durations}, GameModel.duration_tables
+    """
+    seconds = get_timestamp_seconds(duration_tables, path, convert_time_to_seconds(start_time), rng=rng)
+    return [clock_text(s) for s in seconds]
+
 def load_data():
-    # load data
-    event_duration = load_pickle("model_data/event_duration.pkl")
-    event_seqs = load_pickle("model_data/event_seqs.pkl")
-    verb_to_desc = load_json("model_data/desc_template.json") # GPT-4 polished description
-    markov_graph = build_tree_with_probabilities(event_seqs)
-    return event_duration, verb_to_desc, markov_graph
-
-def generate_game(quarter_id, alpha, player_name_dict, team_power):
-    """Generate quarter of game with at most 150 turns
+    # load data, the model is compiled once and cached per process
+    model = GameModel.load()
+    return model.event_duration, model.verb_to_desc, model.markov_graph
+
+class QuarterPlays:
+    """
+        Plays of one generated quarter kept as columns while the quarter is generated, the play dicts of the
+        saved format are only built by plays(). A play is (team index, clock in seconds, compiled template,
+        slot players, scoring), the end of quarter marker has team and template None.
+    """
+    __slots__ = ("teams", "seconds", "templates", "slots", "scoring")
+
+    def __init__(self):
+        self.teams, self.seconds, self.templates, self.slots, self.scoring = [], [], [], [], []
+
+    def add(self, team_id, seconds, template, slot_players, scoring):
+        self.teams.append(team_id)
+        self.seconds.append(seconds)
+        self.templates.append(template)
+        self.slots.append(slot_players)
+        self.scoring.append(scoring)
+
+    def plays(self, player_name_dict):
+        """
+            Play dicts {"team", "time", "description", "ScoringPlay", "points", "player", "assist", "slots"}.
+            "player" and "assist" are indices into the team's players, None when the template has no such
+            player, "slots" the player filled into each slot of the template (None for team slots).
+        """
+        team_name = ['team1', 'team2']
+        names = [[player['name'] for player in player_name_dict[team].values()] for team in team_name]
+        plays = []
+        for team_id, seconds, template, slot_players, scoring in zip(self.teams, self.seconds, self.templates,
+                                                                      self.slots, self.scoring):
+            if template is None:
+                plays.append(quarter_end())
+                continue
+            team = team_name[team_id]
+            plays.append({
+                "team": team,
+                "time": clock_text(seconds),
+                "description": template.render(team, names[team_id], slot_players),
+                "ScoringPlay": scoring,
+                "points": template.points if scoring else 0,
+                "player": None if template.actor is None else slot_players[template.actor],
+                "assist": None if template.assist is None else slot_players[template.assist],
+                "slots": slot_players,
+            })
+        return plays
+
+
+def generate_quarter(quarter_id, alpha, player_name_dict, team_power, model=None, rng=random, player_points=None):
+    """Generate quarter of game with at most 150 turns, as QuarterPlays
         player_name_dict; {"pos":player}
+        model: GameModel, loaded from the compiled artifact if not given
+        rng: source of randomness, random.Random per game for reproducible runs
+        player_points: optional {team: [points of each player]}, the points of every scoring play are added to its scorer
     """
     _density = alpha # density of scoring move
-    total_game = []
-    event_duration, verb_to_desc, markov_graph = load_data()
-    cur_time_stamp = "12:00"
+    quarter = QuarterPlays()
+    if model is None:
+        model = GameModel.load()
+    duration_tables, templates = model.duration_tables, model.templates
+    # the clock stays in seconds, plays get its text when they are emitted
+    cur_seconds = QUARTER_SECONDS
     team_name = ['team1', 'team2']
+    team_positions = [{pos: i for i, pos in enumerate(player_name_dict[team])} for team in team_name]
     total_scoring_move = 0
     total_move = 0
+    profiled = profiling.enabled
+    t = profiling.now() if profiled else 0
     for i in range(200): # at most 150 events in a game
         team_id = i%2
         # get istribution of number of plays in a path according to gaussian distribution
-        num_of_plays = modify_num_play_each_turn(_density)
+        num_of_plays = modify_num_play_each_turn(_density, rng=rng)
         # decide make or miss event
-        _key_event = make_or_miss(team_power[team_id])
+        _key_event = make_or_miss(team_power[team_id], rng=rng)
         cur_team = team_name[team_id]
+        positions = team_positions[team_id]
 
-        path = conditional_turn_generator(markov_graph, num_plays=num_of_plays, key_event=_key_event, quarter=False if quarter_id > 0 else True)
+        path = conditional_turn_generator(model.turn_sampler, num_plays=num_of_plays, key_event=_key_event, quarter=False if quarter_id > 0 else True, rng=rng)
+        if profiled:
+            t = profiling.lap("sample_turn", t)
         
         # validate the number of plays in the path
         if len(path) == 0:
             continue
         
         # stats the ratio of scoring event
-        total_scoring_move += len([ele for ele in path if ele == "make"])
+        total_scoring_move += path.count("make")
         total_move += len(path)
         
-        templates = path_template(path, verb_to_desc)
-        timestamp = get_timestamp(event_duration, path, cur_time_stamp)
-        # display generated game
-        
-        for pos, (time, play) in enumerate(zip(timestamp, templates[0:len(timestamp)])):
-            
-            # decide scores made by the play
-            if path[pos] != "make":
-                score_point = 0
-                Scoring_play = False
-            else:
-                Scoring_play = True
-                score_point = parse_points(play)
-
-            # load players
-            cur_players = player_name_dict[cur_team]
-            play = fill_in_players(play, cur_team, cur_players)
-
-            total_game.append({
-                "team": cur_team,
-                "time": time,
-                "description": play,
-                "ScoringPlay": Scoring_play,
-                "points": score_point,
-            })
-
+        template_ids = path_template_ids(path, templates, model.free_throw_index, rng=rng)
+        timestamp = get_timestamp_seconds(duration_tables, path, cur_seconds, rng=rng)
+        if profiled:
+            t = profiling.lap("templates_timestamps", t)
+
+        for event, seconds, template_id in zip(path, timestamp, template_ids):
+            template = templates[event][template_id]
+            # points are compiled with the template, players drawn now and named when the dicts are built
+            slot_players = template.draw_players(positions, rng=rng)
+            scoring = event == "make"
+            if scoring and player_points is not None and template.actor is not None:
+                player_points[cur_team][slot_players[template.actor]] += template.points
+            quarter.add(team_id, seconds, template, slot_players, scoring)
+
+        if profiled:
+            t = profiling.lap("fill_templates", t)
         if len(timestamp) < len(path): # the generated path will be cut off when the quarter ends
-            total_game.append({
-                "team":None,
-                "time": "0:0",
-                "description": "end of quarter",
-                "ScoringPlay": False,
-                "points": 0
-            })
+            profiling.count("events_cut_off", len(path) - len(timestamp))
+            quarter.add(None, None, None, [], False)
             break
-        cur_time_stamp = timestamp[-1]
+        cur_seconds = timestamp[-1]
+    profiling.observe("turns_per_quarter", i + 1)
     # print(f"total scoring move ratio: {total_scoring_move/total_move}")
-    return total_game
+    return quarter
+
+def generate_game(quarter_id, alpha, player_name_dict, team_power, model=None, rng=random, player_points=None):
+    # play dicts of generate_quarter
+    return generate_quarter(quarter_id, alpha, player_name_dict, team_power, model=model, rng=rng,
+                            player_points=player_points).plays(player_name_dict)
 
-def simulate_single_game(power_list, players_dict, alpha=0.5):
-    random.seed(int(time.time()))
+def game_seed(seed, game_id):
+    """
+        Seed for one game derived from the run's master seed and the game id, so a game
+        does not depend on which worker generates it or in which order.
+    """
+    return int(np.random.SeedSequence([seed, game_id]).generate_state(1, dtype=np.uint64)[0])
+
+def simulate_single_game(power_list, players_dict, alpha=0.5, model=None, rng=None):
+    if rng is None: # legacy behaviour, reseed the global generator
+        random.seed(int(time.time()))
+        rng = random
+    if model is None:
+        model = GameModel.load()
     total_game = []
+    # per-player totals, kept up to date while the plays are generated
+    player_points = {team: [0] * len(players) for team, players in players_dict.items()}
     # game_init = True
     for qid in range(4):
         # # print(qid)
         # if qid > 0:
         #     game_init = False
-        quarter_game = generate_game(qid, alpha=alpha, player_name_dict=players_dict, team_power=power_list)
-        quarter_game.insert(0, {"team": None, "time": "12:00", "description": f"start of quarter {qid+1}", "ScoringPlay": False, "points": 0})
-        total_game.append(quarter_game)
+        total_game.append(generate_quarter(qid, alpha=alpha, player_name_dict=players_dict, team_power=power_list, model=model,
+                                           rng=rng, player_points=player_points))
+    # play dicts are built once the game is complete
+    total_game = [[quarter_start(qid)] + quarter.plays(players_dict) for qid, quarter in enumerate(total_game)]
 
+    return summarize_game(total_game, players_dict, player_points)
+
+def quarter_start(quarter_id):
+    return {"team": None, "time": clock_text(QUARTER_SECONDS), "description": f"start of quarter {quarter_id+1}", "ScoringPlay": False, "points": 0,
+            "player": None, "assist": None, "slots": []}
+
+def quarter_end():
+    return {"team": None, "time": "0:0", "description": "end of quarter", "ScoringPlay": False, "points": 0,
+            "player": None, "assist": None, "slots": []}
+
+def summarize_game(total_game, players_dict, player_points=None):
+    """
+        Wrap the quarters of a game into the saved format {"pbp", "team_players", "team_scores", "player_scores"}
+        player_points: {team: [points of each player]} accumulated during generation, summed from the plays otherwise
+    """
     # append player info at the end of game
     # total_game.append(players[game_id])
     player_dict = {}
@@ -385,12 +468,24 @@ def simulate_single_game(power_list, players_dict, alpha=0.5):
             else:
                 team_score[play['team']] += play['points']
 
+    if player_points is None:
+        player_points = {team: [0] * len(players) for team, players in player_dict.items()}
+        for quarter in total_game:
+            for play in quarter:
+                if play['ScoringPlay'] and play['player'] is not None:
+                    player_points[play['team']][play['player']] += play['points']
+    # anonymous names can repeat within a team, their points add up like the benchmark truth
+    player_scores = {}
+    for team, names in player_dict.items():
+        player_scores[team] = {name: 0 for name in names}
+        for name, points in zip(names, player_points[team]):
+            player_scores[team][name] += points
+
     # final_game
     simulated_game = {
         "pbp":total_game,
         "team_players": player_dict,
-        "team_scores": team_score
-        
-
+        "team_scores": team_score,
+        "player_scores": player_scores
     }
     return simulated_game
\ No newline at end of file
@@ -0,0 +1,202 @@
+import os
+import json
+import pickle
+import hashlib
+
+from utils.TurnSampler import TurnSampler, transition_matrix
+from utils.templates import compile_templates
+from utils.markov_fit import fit_counts, counts_path
+from utils.llm import parse_points_llm, is_offline
+from utils.alias import AliasTable
+from utils import profiling
+
+MODEL_DIR = "model_data"
+SOURCE_FILES = ["event_duration.pkl", "event_seqs.pkl", "desc_template.json"]
+# bump when the layout of the compiled artifact changes
+ARTIFACT_VERSION = 5
+# order of the turn model, 1 is the first order chain of the paper, higher orders condition on more past events
+MARKOV_ORDER = int(os.environ.get("SPORTSGEN_MARKOV_ORDER", 1))
+
+_loaded_models = {}
+
+
+def load_pickle(file_path):
+    with open(file_path, 'rb') as file:
+        var = pickle.load(file)
+    return var
+
+def load_json(file_path):
+    with open(file_path, 'r') as file:
+        var = json.load(file)
+    return var
+
+# Define a function to build a directed graph from a list of event sequences
+def build_tree_with_probabilities(paths):
+    import networkx as nx # only needed when compiling the artifact
+    G = nx.DiGraph()
+    edge_counts = {}
+
+    for path in paths:
+        for i in range(len(path) - 1):
+            edge = (path[i], path[i + 1])
+            if edge not in edge_counts:
+                edge_counts[edge] = 0
+            edge_counts[edge] += 1
+
+    node_counts = {}
+    for (u, v), count in edge_counts.items():
+        if u not in node_counts:
+            node_counts[u] = 0
+        node_counts[u] += count
+
+    for (u, v), count in edge_counts.items():
+        probability = count / node_counts[u]
+        G.add_edge(u, v, weight=probability)
+
+    return G
+
+
+def duration_distribution(event_duration, event):
+    # (durations, probs) of an event, zero second durations only for "make" and goaltending
+    dur_list = []
+    prob_list = []
+    for k,v in event_duration[event].items():
+        if event not in ["make", "defensive goaltending violation"] and k == 0:
+            continue
+        dur_list.append(k)
+        prob_list.append(v)
+    return dur_list, prob_list
+
+
+def source_hash(model_dir=MODEL_DIR, order=1, online=False):
+    """
+        sha256 over the raw model files, the Markov order and whether ambiguous template points are resolved
+        by the LLM (online) or default to 2 (offline), used to key the compiled artifact
+    """
+    h = hashlib.sha256(f"v{ARTIFACT_VERSION}-k{order}-{'online' if online else 'offline'}".encode())
+    for fname in SOURCE_FILES:
+        with open(os.path.join(model_dir, fname), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class GameModel:
+    """
+        Everything generate_game needs from model_data, built once per process.
+        markov_graph: {event: {next_event: {"weight": prob}}}, indexed like a networkx DiGraph
+        event_duration: {event: {seconds: prob}}
+        verb_to_desc: {event: [templates]}
+        transitions: (events, matrix), the graph compiled to an integer indexed transition matrix, or for
+                     markov_order > 1 (states, matrix, state_events, start_states) of the higher order chain
+        markov_order: number of past events the turn model conditions on (markov_graph is always first order)
+        templates: {event: [CompiledTemplate]}, free_throw_index: {event: first "free throw" template}
+        ambiguous_templates: "make" templates whose points no rule recognised
+        point_overrides: {template: points} resolved by the LLM backend for ambiguous templates
+        duration_tables: {event: AliasTable of durations in seconds}
+        step_tables: alias tables of the turn sampler saved with the artifact, built on first use otherwise
+    """
+    def __init__(self, markov_graph, event_duration, verb_to_desc, source_hash=None, transitions=None, point_overrides=None,
+                 markov_order=1, step_tables=None):
+        self.markov_graph = markov_graph
+        self.markov_order = markov_order
+        self.event_duration = event_duration
+        self.verb_to_desc = verb_to_desc
+        self.source_hash = source_hash
+        self.transitions = transitions or transition_matrix(markov_graph)
+        self.point_overrides = point_overrides or {}
+        self.templates, self.free_throw_index, self.ambiguous_templates = compile_templates(verb_to_desc, self.point_overrides)
+        self.duration_tables = {event: AliasTable(*duration_distribution(event_duration, event)) for event in event_duration}
+        self.step_tables = step_tables
+        self._turn_sampler = None
+
+    @property
+    def turn_sampler(self):
+        if self._turn_sampler is None:
+            self._turn_sampler = TurnSampler(*self.transitions, step_tables=self.step_tables)
+        return self._turn_sampler
+
+    @classmethod
+    def build(cls, model_dir=MODEL_DIR, order=1, online=False):
+        # fit the model from the raw files in model_dir, online: resolve ambiguous template points with the LLM
+        event_duration = load_pickle(os.path.join(model_dir, "event_duration.pkl"))
+        event_seqs = load_pickle(os.path.join(model_dir, "event_seqs.pkl"))
+        verb_to_desc = load_json(os.path.join(model_dir, "desc_template.json")) # GPT-4 polished description
+        # transition counts are cached, sequences appended to event_seqs.pkl are counted on their own
+        with profiling.stage("fit_markov"):
+            counts, _ = fit_counts(event_seqs, counts_path(model_dir))
+            markov_graph = counts.first_order_graph()
+            transitions = transition_matrix(markov_graph) if order == 1 else counts.chain(order)
+        event_duration = {event: dict(counter) for event, counter in event_duration.items()}
+        model = cls(markov_graph, event_duration, verb_to_desc, source_hash(model_dir, order, online), transitions, markov_order=order)
+        unresolved = [text for text in model.ambiguous_templates if text not in model.point_overrides]
+        if unresolved and online:
+            # one concurrent batch of LLM queries at build time, never during generation
+            resolved = {text: points for text, points in zip(unresolved, parse_points_llm([t.lower() for t in unresolved]))
+                        if points is not None}
+            if resolved:
+                model = cls(markov_graph, event_duration, verb_to_desc, model.source_hash, model.transitions, resolved, order)
+            unresolved = [text for text in unresolved if text not in resolved]
+        if unresolved:
+            print(f"{len(unresolved)} make templates scored with the default 2 points:")
+            for text in unresolved:
+                print(f"  {text}")
+        # the alias tables of the turn sampler are saved with the model, a run of a higher order model
+        # would spend seconds on them otherwise
+        with profiling.stage("build_turn_tables"):
+            model.turn_sampler.warm()
+        return model
+
+    def to_artifact(self):
+        return {
+            "version": ARTIFACT_VERSION,
+            "source_hash": self.source_hash,
+            "markov_graph": self.markov_graph,
+            "event_duration": self.event_duration,
+            "verb_to_desc": self.verb_to_desc,
+            "transitions": self.transitions,
+            "point_overrides": self.point_overrides,
+            "markov_order": self.markov_order,
+            "step_tables": self.turn_sampler.step_tables(),
+        }
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        return cls(artifact["markov_graph"], artifact["event_duration"], artifact["verb_to_desc"],
+                   artifact["source_hash"], artifact["transitions"], artifact["point_overrides"], artifact["markov_order"],
+                   artifact["step_tables"])
+
+    def save(self, file_path):
+        # write-then-rename so concurrent workers never read a partial artifact
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.to_artifact(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, model_dir=MODEL_DIR, rebuild=False, order=None):
+        """
+            Return the process-wide model for model_dir.
+            The compiled artifact is keyed by the hash of the source files, so editing
+            any of them triggers a rebuild on the next load. Models built offline and online are kept apart,
+            the first online load resolves the ambiguous template points an offline build left at 2.
+            order: Markov order of the turn model, MARKOV_ORDER (SPORTSGEN_MARKOV_ORDER) by default
+        """
+        order = MARKOV_ORDER if order is None else order
+        key = (model_dir, order)
+        if key in _loaded_models and not rebuild:
+            return _loaded_models[key]
+        online = not is_offline()
+        digest = source_hash(model_dir, order, online)
+        artifact_path = os.path.join(model_dir, "compiled", f"game_model-{digest[:16]}.pkl")
+        model = None
+        if os.path.exists(artifact_path) and not rebuild:
+            artifact = load_pickle(artifact_path)
+            if artifact.get("version") == ARTIFACT_VERSION and artifact.get("source_hash") == digest:
+                model = cls.from_artifact(artifact)
+        if model is None:
+            profiling.count("model_builds")
+            model = cls.build(model_dir, order, online)
+            model.save(artifact_path)
+        _loaded_models[key] = model
+        return model
@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import shutil
+from glob import glob
+
+import numpy as np
+
+STORE_FILE = "store.json"
+STORE_FORMAT = "sportsgen-store"
+STORE_VERSION = 2 # 2 adds the structured play fields, stores of version 1 are still read
+READ_VERSIONS = (1, 2)
+SHARD_SIZE = 1000 # games per shard
+MARKER = "\x00" # stands for a team/player name in interned descriptions
+
+# flags column
+SCORING = 1
+SHORT_CLOCK = 2 # clock printed without zero padding, e.g. "0:0" at the end of a quarter
+
+PLAY_KEYS = {"team", "time", "description", "ScoringPlay", "points"}
+STRUCTURED_KEYS = {"player", "assist", "slots"} # plays of games generated since the structured fields
+COLUMNS = {
+    "team": np.int8, # index into the game's teams, -1 for None
+    "clock": np.int16, # seconds left in the quarter
+    "flags": np.uint8,
+    "points": np.int8,
+    "desc": np.int32, # index into the shard's string table
+    "num_fills": np.uint8, # names substituted into the description
+    "fills": np.int8, # name ids, num_fills per play
+    "player": np.int8, # index into the team's players, -1 for None
+    "assist": np.int8, # same
+    "num_slots": np.uint8,
+    "slots": np.int8, # player of each template slot, -1 for None, num_slots per play
+}
+
+
+def is_game_store(path):
+    return os.path.exists(os.path.join(path, STORE_FILE))
+
+def parse_clock(timestamp):
+    minutes, seconds = timestamp.split(":")
+    seconds_left = int(minutes) * 60 + int(seconds)
+    if format_clock(seconds_left, False) == timestamp:
+        return seconds_left, False
+    if format_clock(seconds_left, True) == timestamp:
+        return seconds_left, True
+    raise ValueError(f"Unsupported clock: {timestamp}")
+
+def format_clock(seconds_left, short=False):
+    minutes, seconds = divmod(seconds_left, 60)
+    return f"{minutes}:{seconds}" if short else f"{minutes}:{seconds:02d}"
+
+_clock_texts = {}
+_player_ids = list(range(np.iinfo(np.int8).max)) + [None] # index -1 is None
+
+def clock_text(code):
+    # code = 2 * seconds left + short, each clock string is formatted once per process
+    _clock_texts[code] = format_clock(code >> 1, code & 1)
+    return _clock_texts[code]
+
+def game_names(game):
+    # names replaced by markers in descriptions: team names first, then players
+    team_players = game["team_players"]
+    return list(team_players.keys()) + [p for players in team_players.values() for p in players]
+
+def name_pattern(names):
+    # longest first, so "player_12" is not matched as "player_1"
+    return re.compile("|".join(re.escape(n) for n in sorted(set(names), key=len, reverse=True)))
+
+
+class GameStoreWriter:
+    """
+        Append games to a store folder, one shard of columns per shard_size games.
+        A shard is written to a temporary folder and renamed once complete.
+        on_flush: optional callback(shard name, [game names]) called after a shard is complete
+    """
+    def __init__(self, path, shard_size=SHARD_SIZE, on_flush=None):
+        self.path = path
+        self.shard_size = shard_size
+        self.on_flush = on_flush
+        os.makedirs(path, exist_ok=True)
+        if not is_game_store(path):
+            with open(os.path.join(path, STORE_FILE), 'w') as f:
+                json.dump({"format": STORE_FORMAT, "version": STORE_VERSION}, f)
+        self.shard_id = len(list_shards(path))
+        self._reset()
+
+    def _reset(self):
+        self.columns = {name: [] for name in COLUMNS}
+        self.strings = {}
+        self.meta = []
+
+    def add(self, game_name, game):
+        names = game_names(game)
+        if len(names) > np.iinfo(np.int8).max:
+            raise ValueError(f"Too many names in {game_name}: {len(names)}")
+        name_ids = {}
+        for i, name in enumerate(names):
+            name_ids.setdefault(name, i)
+        teams = list(game["team_players"].keys())
+        pattern = name_pattern(names)
+        quarters = []
+        offset = len(self.columns["team"])
+        structured = bool(game["pbp"]) and bool(game["pbp"][0]) and STRUCTURED_KEYS <= game["pbp"][0][0].keys()
+        play_keys = PLAY_KEYS | STRUCTURED_KEYS if structured else PLAY_KEYS
+        for quarter in game["pbp"]:
+            quarters.append(len(quarter))
+            for play in quarter:
+                if play.keys() != play_keys:
+                    raise ValueError(f"Unsupported play fields in {game_name}: {sorted(play.keys())}")
+                if MARKER in play["description"]:
+                    raise ValueError(f"Unsupported character in {game_name}: {play['description']!r}")
+                seconds_left, short = parse_clock(play["time"])
+                fills = [name_ids[m.group(0)] for m in pattern.finditer(play["description"])]
+                template = pattern.sub(MARKER, play["description"])
+                self.columns["team"].append(-1 if play["team"] is None else teams.index(play["team"]))
+                self.columns["clock"].append(seconds_left)
+                self.columns["flags"].append(SCORING * bool(play["ScoringPlay"]) | SHORT_CLOCK * short)
+                self.columns["points"].append(play["points"])
+                self.columns["desc"].append(self.strings.setdefault(template, len(self.strings)))
+                self.columns["num_fills"].append(len(fills))
+                self.columns["fills"].extend(fills)
+                slots = play["slots"] if structured else []
+                self.columns["player"].append(-1 if not structured or play["player"] is None else play["player"])
+                self.columns["assist"].append(-1 if not structured or play["assist"] is None else play["assist"])
+                self.columns["num_slots"].append(len(slots))
+                self.columns["slots"].extend(-1 if p is None else p for p in slots)
+        extra = {k: v for k, v in game.items() if k != "pbp"}
+        meta = {"game": game_name, "offset": offset, "quarters": quarters, "extra": extra}
+        if structured:
+            meta["structured"] = True
+        self.meta.append(meta)
+        if len(self.meta) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.meta:
+            return
+        shard_dir = os.path.join(self.path, f"shard_{self.shard_id:05d}")
+        tmp_dir = shard_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.array(self.columns[name], dtype=dtype))
+        with open(os.path.join(tmp_dir, "strings.json"), 'w') as f:
+            json.dump(list(self.strings), f)
+        with open(os.path.join(tmp_dir, "meta.jsonl"), 'w') as f:
+            f.writelines(json.dumps(m) + "\n" for m in self.meta)
+        os.rename(tmp_dir, shard_dir)
+        if self.on_flush is not None:
+            self.on_flush(os.path.basename(shard_dir), [m["game"] for m in self.meta])
+        self.shard_id += 1
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def list_shards(path):
+    return sorted(d for d in os.listdir(path) if d.startswith("shard_") and not d.endswith(".tmp"))
+
+
+class Shard:
+    """
+        Memory-mapped columns of one shard.
+    """
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        # shards of version 1 stores have no structured play columns
+        self.columns = {name: np.load(os.path.join(shard_dir, f"{name}.npy"), mmap_mode='r') for name in COLUMNS
+                        if os.path.exists(os.path.join(shard_dir, f"{name}.npy"))}
+        with open(os.path.join(shard_dir, "strings.json"), 'r') as f:
+            # descriptions as printf templates, a description is then one formatting of its names
+            self.formats = [s.replace("%", "%%").replace(MARKER, "%s") for s in json.load(f)]
+        with open(os.path.join(shard_dir, "meta.jsonl"), 'r') as f:
+            self.meta = [json.loads(line) for line in f]
+        self.fill_offsets = np.concatenate([[0], np.cumsum(self.columns["num_fills"], dtype=np.int64)])
+        if "num_slots" in self.columns:
+            self.slot_offsets = np.concatenate([[0], np.cumsum(self.columns["num_slots"], dtype=np.int64)])
+
+    def game(self, i):
+        meta = self.meta[i]
+        start = meta["offset"]
+        end = start + sum(meta["quarters"])
+        team, clock, flags, points, desc = (self.columns[c][start:end]
+                                            for c in ["team", "clock", "flags", "points", "desc"])
+        codes = (clock.astype(np.int32) * 2 + (flags & SHORT_CLOCK > 0)).tolist()
+        times = [_clock_texts.get(code) or clock_text(code) for code in codes]
+        names = game_names(meta["extra"])
+        fills = [names[f] for f in self.columns["fills"][self.fill_offsets[start]:self.fill_offsets[end]].tolist()]
+        fill_bounds = (self.fill_offsets[start:end + 1] - self.fill_offsets[start]).tolist()
+        formats = self.formats
+        descriptions = [formats[d] % tuple(fills[a:b])
+                        for d, a, b in zip(desc.tolist(), fill_bounds[:-1], fill_bounds[1:])]
+        # index -1 is None
+        teams = list(meta["extra"]["team_players"].keys()) + [None]
+        columns = zip(team.tolist(), times, descriptions, (flags & SCORING > 0).tolist(), points.tolist())
+        if meta.get("structured"):
+            players = _player_ids
+            slots = [players[p] for p in self.columns["slots"][self.slot_offsets[start]:self.slot_offsets[end]].tolist()]
+            slot_bounds = (self.slot_offsets[start:end + 1] - self.slot_offsets[start]).tolist()
+            plays = [{"team": teams[t], "time": tm, "description": d, "ScoringPlay": sc, "points": p,
+                      "player": players[pl], "assist": players[a], "slots": slots[s0:s1]}
+                     for (t, tm, d, sc, p), pl, a, s0, s1 in zip(columns, self.columns["player"][start:end].tolist(),
+                                                               self.columns["assist"][start:end].tolist(),
+                                                               slot_bounds[:-1], slot_bounds[1:])]
+        else:
+            plays = [{"team": teams[t], "time": tm, "description": d, "ScoringPlay": sc, "points": p}
+                     for t, tm, d, sc, p in columns]
+        pbp = []
+        bounds = np.cumsum([0] + meta["quarters"]).tolist()
+        for q_start, q_end in zip(bounds[:-1], bounds[1:]):
+            pbp.append(plays[q_start:q_end])
+        return {"pbp": pbp, **meta["extra"]}
+
+    def iter_games(self):
+        # games in storage order
+        for i, meta in enumerate(self.meta):
+            yield meta["game"], self.game(i)
+
+
+class GameStore:
+    """
+        Read access to a store folder.
+        store[game_name]: one game in the dict format of game_{id}.json
+        iter_games(): (game_name, game) in the order of sorted file names, as a JSON folder is read
+        Games load only about 1.5x faster than the JSON files, most of the time goes into the play dicts.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, STORE_FILE), 'r') as f:
+            info = json.load(f)
+        if info.get("format") != STORE_FORMAT or info.get("version") not in READ_VERSIONS:
+            raise ValueError(f"Unsupported game store: {info}")
+        self.shard_dirs = [os.path.join(path, d) for d in list_shards(path)]
+        self._shards = {}
+        self.index = {}
+        for shard_id, shard_dir in enumerate(self.shard_dirs):
+            with open(os.path.join(shard_dir, "meta.jsonl"), 'r') as f:
+                for i, line in enumerate(f):
+                    self.index[json.loads(line)["game"]] = (shard_id, i)
+
+    def shard(self, shard_id):
+        if shard_id not in self._shards:
+            self._shards[shard_id] = Shard(self.shard_dirs[shard_id])
+        return self._shards[shard_id]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, game_name):
+        return game_name in self.index
+
+    def __getitem__(self, game_name):
+        shard_id, i = self.index[game_name]
+        return self.shard(shard_id).game(i)
+
+    def game_names(self):
+        return sorted(self.index)
+
+    def iter_games(self):
+        for game_name in self.game_names():
+            yield game_name, self[game_name]
+
+
+def convert_folder(game_folder, save_dir, shard_size=SHARD_SIZE):
+    """
+        Pack a folder of game_{id}.json files into a store.
+    """
+    with GameStoreWriter(save_dir, shard_size) as writer:
+        for fpath in sorted(glob(os.path.join(game_folder, "*.json"))):
+            with open(fpath, 'r') as f:
+                writer.add(os.path.basename(fpath).split(".")[0], json.load(f))
@@ -1,6 +1,8 @@
 import random
 import json
-import numpy as np
+
+from array import array
+from bisect import bisect_left, bisect_right
 # load nba players profiles
 
 def load_players():
@@ -12,62 +14,115 @@ def load_players():
 def is_player_in_team(player_name, team):
     return any(team_member["name"] == player_name["player"] for team_member in team)
 
+POSITIONS = ["PG", "SG", "SF", "PF", "C"]
+
+_roster = None
+
+
+class RosterIndex:
+    """
+        Compact, loaded-once view of NBAplayer.json holding only what team selection uses.
+        Players without biographic information are dropped, ids follow the file order.
+        by_position[pos] = (overall ratings ascending, player ids) so that
+        "players at pos with Overall >= x" is a bisect plus a slice.
+        file_order[pos] = ids of players at pos in file order, used for the bench scan.
+    """
+    def __init__(self, players):
+        self.names = []
+        self.positions = []
+        self.position_mask = array('B')
+        self.overall = array('h')
+        self.inside = array('h')
+        self.outside = array('h')
+        for player in players:
+            if player["biographic information"] is None:
+                continue
+            position = player['biographic information']['Position']
+            self.names.append(player["player"])
+            self.positions.append(position)
+            self.position_mask.append(sum(1 << i for i, pos in enumerate(POSITIONS) if pos in position))
+            self.overall.append(player["general abilities"]["Overall"])
+            self.inside.append(player["general abilities"]["Inside Scoring"])
+            self.outside.append(player["general abilities"]["Outside Scoring"])
+        self.by_position = {}
+        self.file_order = {}
+        for i, pos in enumerate(POSITIONS):
+            ids = [pid for pid in range(len(self.names)) if self.position_mask[pid] >> i & 1]
+            self.file_order[pos] = ids
+            ids = sorted(ids, key=lambda pid: self.overall[pid])
+            self.by_position[pos] = ([self.overall[pid] for pid in ids], ids)
+
+    def at_least(self, pos, rating):
+        ratings, ids = self.by_position[pos]
+        return ids[bisect_left(ratings, rating):]
+
+    def at_most(self, pos, rating):
+        ratings, ids = self.by_position[pos]
+        return ids[:bisect_right(ratings, rating)]
+
+    def profile(self, pid):
+        return {"name": self.names[pid], "position": self.positions[pid],
+                "general_abilities": {"Overall": self.overall[pid],
+                                      "Inside Scoring": self.inside[pid],
+                                      "Outside Scoring": self.outside[pid]}}
+
+
+def load_roster():
+    global _roster
+    if _roster is None:
+        _roster = RosterIndex(load_players())
+    return _roster
+
 def select_team_players(lowest_score_strong_team,
                         highest_score_weak_team,
-                        anonymous=False):
+                        anonymous=False,
+                        rng=random):
     # select a strong team with with overall rating > upper_bound
     # select a weak team with overall rating < lower_bound
     # each team select 10 players. 
     strong_lower = lowest_score_strong_team
     weak__upper = highest_score_weak_team
-    players = load_players()
-    positions = ["PG", "SG", "SF", "PF", "C"]
-    strong_team = [] # profile of strong team element={name, general_abilities}
-    weak_team = []
-    
+    roster = load_roster()
+    strong_ids = [] # player ids of strong team, profiles are built at the end
+    weak_ids = []
+
     # select Starter players for both team
-    for p, pos in enumerate(positions):
-            
-        
-        strong_player_list = [player for player in players if player["biographic information"] is not None 
-                      and pos in player['biographic information']['Position'] 
-                      and player["general abilities"]["Overall"] >= strong_lower 
-                      and not is_player_in_team(player, strong_team)]
-        weak_team_list = [player for player in players if player["biographic information"] is not None 
-                        and pos in player['biographic information']['Position'] 
-                        and player["general abilities"]["Overall"] <= weak__upper 
-                        and not is_player_in_team(player, weak_team)]
-        
-        strong_player = random.choice(strong_player_list)
-        weak_player = random.choice(weak_team_list)
-        
-        if len(strong_team) != p+1:
-            strong_team.append({"name": strong_player["player"], "position":strong_player['biographic information']['Position']\
-                            , "general_abilities": strong_player["general abilities"]})
-        if len(weak_team) != p+1:
-            weak_team.append({"name": weak_player["player"],"position":weak_player['biographic information']['Position']\
-                            , "general_abilities": weak_player["general abilities"]})
-
-    # select bench players for both team
-    strong_team_exist_player = [player['name'] for player in strong_team]
-    weak_team_exist_player = [player['name'] for player in weak_team]
-    cur_pos = random.choice(positions) # randomly assign position
-    for player in players:
-        if player['biographic information'] is None or player['player'] in strong_team_exist_player or player['player'] in weak_team_exist_player:
-            continue
-        if cur_pos not in player['biographic information']['Position']:
-            continue
-        if player["general abilities"]["Overall"] >= strong_lower and len(strong_team) < 10:
-            strong_team.append({"name": player["player"], "position":player['biographic information']['Position'], "general_abilities": player["general abilities"]})
-            cur_pos = random.choice(positions)
-        if player["general abilities"]["Overall"] < weak__upper and len(weak_team) < 10:
-            weak_team.append({"name": player["player"], "position":player['biographic information']['Position'], "general_abilities": player["general abilities"]}) 
-            cur_pos = random.choice(positions)\
-    
+    for pos in POSITIONS:
+        strong_player_list = [pid for pid in roster.at_least(pos, strong_lower) if pid not in strong_ids]
+        weak_team_list = [pid for pid in roster.at_most(pos, weak__upper) if pid not in weak_ids]
+        strong_ids.append(rng.choice(strong_player_list))
+        weak_ids.append(rng.choice(weak_team_list))
+
+    # select bench players for both team, scanning the file order as the starters were picked from it
+    starters = set(strong_ids) | set(weak_ids)
+    cur_pos = rng.choice(POSITIONS) # randomly assign position
+    next_id = 0
+    while len(strong_ids) < 10 or len(weak_ids) < 10:
+        candidates = roster.file_order[cur_pos]
+        for pid in candidates[bisect_left(candidates, next_id):]:
+            if pid in starters:
+                continue
+            strong_fit = roster.overall[pid] >= strong_lower and len(strong_ids) < 10
+            weak_fit = roster.overall[pid] < weak__upper and len(weak_ids) < 10
+            if strong_fit or weak_fit:
+                break
+        else:
+            break # no player left after next_id at this position
+        next_id = pid + 1
+        if strong_fit:
+            strong_ids.append(pid)
+            cur_pos = rng.choice(POSITIONS)
+        if weak_fit:
+            weak_ids.append(pid)
+            cur_pos = rng.choice(POSITIONS)
+
+    strong_team = [roster.profile(pid) for pid in strong_ids] # profile of strong team element={name, general_abilities}
+    weak_team = [roster.profile(pid) for pid in weak_ids]
+
     # anomymous the player name
     if anonymous:
         total_palayer = len(strong_team) + len(weak_team)
-        random_player_id = np.random.choice(np.arange(1,100), size=total_palayer, replace=True)
+        random_player_id = rng.choices(range(1,100), k=total_palayer)
         for p, player in enumerate(strong_team+weak_team):
             player['name'] = f"Player{random_player_id[p]}"
     return_data_obj = {"strong_team": strong_team, "weak_team": weak_team}
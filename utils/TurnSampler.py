@@ -0,0 +1,226 @@
+import random
+
+import numpy as np
+
+from utils.alias import AliasTable, alias_arrays
+
+MAX_TURN_LENGTH = 30 # longest turn considered when the length is not conditioned on
+MAX_MAKES = 2 # generate_turn never emits a third "make" in one turn
+LIST_TABLE_STATES = 32 # alias tables of larger chains (higher order models) stay numpy arrays instead of nested lists
+
+
+class InfeasibleTurnError(ValueError):
+    """
+        Raised when no turn satisfies the requested (length, makes, miss) condition.
+    """
+    def __init__(self, num_plays, makes, require_miss, start):
+        self.num_plays = num_plays
+        self.makes = makes
+        self.require_miss = require_miss
+        self.start = start
+        super().__init__(f"no turn from '{start}' with num_plays={num_plays}, makes={makes}, require_miss={require_miss}")
+
+
+def transition_matrix(markov_graph):
+    """
+        Compile {event: {next_event: {"weight": p}}} into (events, matrix) with matrix[i, j] = P(events[j] | events[i])
+    """
+    events = sorted(set(markov_graph.keys()) | {v for children in markov_graph.values() for v in children})
+    index = {event: i for i, event in enumerate(events)}
+    matrix = np.zeros((len(events), len(events)))
+    for u, children in markov_graph.items():
+        for v, attr in children.items():
+            matrix[index[u], index[v]] = attr["weight"]
+    return events, matrix
+
+
+class TurnSampler:
+    """
+        Draw a turn (events between "start" and "end") exactly from the Markov chain
+        conditioned on its length, its number of "make" events and whether it contains a "miss".
+
+        states: the chain works on states, each emitting one event (state_events[i]);
+                for the first order model a state is simply the event.
+        matrix: transition probabilities between states.
+        For every condition we compute W[r, m, s, u]: the probability that, standing on state u with
+        m makes and miss flag s, the chain emits exactly r more events and then hits "end" with the
+        condition satisfied. Sampling then walks forward with weights P(u, v) * W[r-1, m', s', v], over the
+        successors of u only (successors[u], padded), since the chains are sparse.
+        step_tables: {(makes, require_miss): (prob, alias)} of step_alias saved with the compiled model
+    """
+    def __init__(self, states, matrix, state_events=None, start_states=None, step_tables=None):
+        self.states = states
+        self.state_events = list(states) if state_events is None else state_events
+        self.matrix = np.asarray(matrix, dtype=float)
+        self.end = self.state_events.index("end")
+        self.is_make = np.array([e == "make" for e in self.state_events])
+        self.is_miss = np.array([e == "miss" for e in self.state_events])
+        # state to start from for a regular turn ("start") and a quarter opening ("vs")
+        self.start_states = start_states or {e: self.state_events.index(e) for e in ["start", "vs"] if e in self.state_events}
+        # once two makes are in the turn the "make" transitions are removed and rows renormalized,
+        # exactly as generate_turn does with random.choices
+        no_make = self.matrix * ~self.is_make
+        row_sum = no_make.sum(axis=1, keepdims=True)
+        no_make = np.divide(no_make, row_sum, out=np.zeros_like(no_make), where=row_sum > 0)
+        self.by_makes = [self.matrix] * MAX_MAKES + [no_make]
+        # successor states of every state, padded with state 0 at zero weight
+        degree = (self.matrix > 0).sum(axis=1)
+        self.successors = np.zeros((len(self.states), max(int(degree.max()), 1)), dtype=np.int64)
+        for u, row in enumerate(self.matrix):
+            targets = np.flatnonzero(row > 0)
+            self.successors[u, :len(targets)] = targets
+        self._successor_lists = self.successors.tolist()
+        self._step_tables = dict(step_tables or {})
+        self._tables = {}
+        self._alias = {}
+        self._make_weights = {}
+
+    @classmethod
+    def from_graph(cls, markov_graph):
+        events, matrix = transition_matrix(markov_graph)
+        return cls(events, matrix)
+
+    def _table(self, makes, require_miss):
+        key = (makes, require_miss)
+        if key not in self._tables:
+            n = len(self.states)
+            W = np.zeros((MAX_TURN_LENGTH + 1, MAX_MAKES + 1, 2, n))
+            for m in range(MAX_MAKES + 1):
+                for s in range(2):
+                    if (makes is None or m == makes) and (s == 1 or not require_miss):
+                        W[0, m, s] = self.by_makes[m][:, self.end]
+            for r in range(1, MAX_TURN_LENGTH + 1):
+                for m in range(MAX_MAKES + 1):
+                    for s in range(2):
+                        W[r, m, s] = self.by_makes[m] @ self._next_weights(W[r - 1], m, s)
+            self._tables[key] = W
+        return self._tables[key]
+
+    def _next_weights(self, W_prev, m, s):
+        # W_prev[m', s', v] for every candidate next state v given the current (m, s)
+        m_next = np.where(self.is_make, min(m + 1, MAX_MAKES), m)
+        s_next = np.where(self.is_miss, 1, s)
+        weights = W_prev[m_next, s_next, np.arange(len(self.states))]
+        weights[self.end] = 0
+        return weights
+
+    def step_weights(self, makes=None, require_miss=False):
+        """
+            Unnormalized next-state weights for every (remaining, makes, miss, state) over the successors of
+            the state: out[r, m, s, u, j] = P_m(u, v) * W[r-1, m', s', v] with v = successors[u, j], zero for r = 0.
+            Used by the batch simulator to walk many turns at once.
+        """
+        W = self._table(makes, require_miss)
+        n = len(self.states)
+        rows = np.arange(n)[:, None]
+        out = np.zeros((MAX_TURN_LENGTH + 1, MAX_MAKES + 1, 2, n, self.successors.shape[1]))
+        for r in range(1, MAX_TURN_LENGTH + 1):
+            for m in range(MAX_MAKES + 1):
+                for s in range(2):
+                    weights = self.by_makes[m] * self._next_weights(W[r - 1], m, s)
+                    out[r, m, s] = weights[rows, self.successors]
+        # padding repeats state 0, it must never be drawn
+        out[..., (self.matrix[rows, self.successors] <= 0)] = 0
+        return out
+
+    def step_alias(self, makes=None, require_miss=False):
+        """
+            Alias tables (prob, alias) of step_weights, built once per condition or taken from step_tables.
+            Returned as numpy arrays and as nested lists for fast scalar indexing, the arrays themselves
+            for chains of more than LIST_TABLE_STATES states.
+        """
+        key = (makes, require_miss)
+        if key not in self._alias:
+            if key not in self._step_tables:
+                # compact dtypes, the tables are saved with the compiled model
+                prob, alias = alias_arrays(self.step_weights(makes, require_miss))
+                self._step_tables[key] = (prob.astype(np.float32), alias.astype(np.min_scalar_type(alias.shape[-1])))
+            prob, alias = self._step_tables[key]
+            lengths = {start: AliasTable(range(MAX_TURN_LENGTH + 1), self.length_weights(makes, require_miss, start))
+                       for start in self.start_states}
+            if len(self.states) > LIST_TABLE_STATES:
+                self._alias[key] = (prob, alias, prob, alias, lengths)
+            else:
+                self._alias[key] = (prob, alias, prob.tolist(), alias.tolist(), lengths)
+        return self._alias[key]
+
+    def warm(self, conditions=((1, False), (2, False), (0, True))):
+        # build the alias tables of the (makes, require_miss) conditions generate_game uses,
+        # before forking so every worker inherits them
+        for makes, require_miss in conditions:
+            self.step_alias(makes, require_miss)
+
+    def step_tables(self):
+        # alias arrays of every condition built so far, for the compiled model
+        return dict(self._step_tables)
+
+    def length_weights(self, makes=None, require_miss=False, start="start"):
+        # unnormalized P(num_plays = r | condition) for r = 0..MAX_TURN_LENGTH, r = 0 never drawn
+        W = self._table(makes, require_miss)
+        weights = W[:, 0, 0, self.start_states[start]].copy()
+        weights[0] = 0
+        return weights
+
+    def make_weights(self, makes, start="start"):
+        """
+            (probability of a turn with makes makes at any length, P(num_plays = r) of a turn with the
+            other number of makes for r = 0..MAX_TURN_LENGTH), cached as a float and a list.
+        """
+        key = (makes, start)
+        if key not in self._make_weights:
+            other = MAX_MAKES + 1 - makes
+            self._make_weights[key] = (float(self.length_weights(makes, start=start).sum()),
+                                       self.length_weights(other, start=start).tolist())
+        return self._make_weights[key]
+
+    def sample_make(self, num_plays, makes, start="start", rng=random):
+        """
+            A "make" turn as the rejection loop of generate_turn accepted it: the drawn number of makes
+            (1 or 2) at any length, or the other number of makes at exactly num_plays events, each in
+            proportion to its probability under the chain.
+            Raises InfeasibleTurnError when neither is possible.
+        """
+        any_length, other_lengths = self.make_weights(makes, start)
+        at_length = other_lengths[num_plays] if 0 < num_plays <= MAX_TURN_LENGTH else 0.0
+        if any_length + at_length <= 0:
+            raise InfeasibleTurnError(num_plays, makes, False, start)
+        if rng.random() * (any_length + at_length) < any_length:
+            return self.sample(None, makes=makes, start=start, rng=rng)
+        return self.sample(num_plays, makes=MAX_MAKES + 1 - makes, start=start, rng=rng)
+
+    def is_feasible(self, num_plays, makes=None, require_miss=False, start="start"):
+        W = self._table(makes, require_miss)
+        u = self.start_states[start]
+        if num_plays is None:
+            return W[1:, 0, 0, u].sum() > 0
+        return 0 < num_plays <= MAX_TURN_LENGTH and W[num_plays, 0, 0, u] > 0
+
+    def sample(self, num_plays, makes=None, require_miss=False, start="start", rng=random):
+        """
+            num_plays: number of events after the start state, None to draw the length from the chain
+            makes: exact number of "make" events, None for any
+            require_miss: the turn must contain at least one "miss"
+            start: "start" for a regular turn, "vs" to open with a jump ball (kept in the path)
+            Raises InfeasibleTurnError when the condition has zero probability.
+        """
+        if not self.is_feasible(num_plays, makes, require_miss, start):
+            raise InfeasibleTurnError(num_plays, makes, require_miss, start)
+        _, _, prob, alias, lengths = self.step_alias(makes, require_miss)
+        u = self.start_states[start]
+        if num_plays is None:
+            num_plays = lengths[start].sample(rng)
+
+        path = [self.state_events[u]] if start != "start" else []
+        m, s = 0, 0
+        successors = self._successor_lists
+        width = len(successors[0])
+        for r in range(num_plays, 0, -1):
+            i = int(rng.random() * width)
+            u = successors[u][i if rng.random() < prob[r][m][s][u][i] else alias[r][m][s][u][i]]
+            event = self.state_events[u]
+            path.append(event)
+            if event == "make":
+                m = min(m + 1, MAX_MAKES)
+            elif event == "miss":
+                s = 1
+        return path
@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+
+
+def alias_row(weights):
+    """
+        Vose's alias method for one categorical distribution.
+        Returns (prob, alias) lists: draw i uniformly, keep it with probability prob[i], else take alias[i].
+        An all-zero row gives prob = 1 everywhere, it must never be sampled from.
+    """
+    n = len(weights)
+    total = float(sum(weights))
+    if total <= 0:
+        return [1.0] * n, list(range(n))
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1 - scaled[s]
+        (small if scaled[l] < 1 else large).append(l)
+    # leftovers are 1 up to rounding
+    return prob, alias
+
+
+def alias_arrays(weights):
+    """
+        Alias tables for every row of an n-d weight array (categories on the last axis).
+        Returns (prob, alias) arrays of the same shape.
+    """
+    weights = np.asarray(weights, dtype=float)
+    rows = weights.reshape(-1, weights.shape[-1])
+    prob = np.ones(rows.shape)
+    alias = np.zeros(rows.shape, dtype=np.int64)
+    for i, row in enumerate(rows.tolist()):
+        prob[i], alias[i] = alias_row(row)
+    return prob.reshape(weights.shape), alias.reshape(weights.shape)
+
+
+def sample_alias(prob, alias, np_rng, sizes=None):
+    """
+        Vectorized draw, one column index per row of (k, n) prob/alias tables.
+        sizes: (k,) number of categories per row when rows of different sizes are padded to n
+    """
+    k, n = prob.shape
+    i = (np_rng.random(k) * (n if sizes is None else sizes)).astype(np.int64)
+    rows = np.arange(k)
+    return np.where(np_rng.random(k) < prob[rows, i], i, alias[rows, i])
+
+
+class AliasTable:
+    """
+        O(1) sampler for a fixed categorical distribution over values.
+        sample(rng): one value with a random.Random (or the random module)
+        sample_many(np_rng, size): array of values with a numpy Generator
+    """
+    __slots__ = ("values", "prob", "alias", "n")
+
+    def __init__(self, values, weights):
+        self.values = list(values)
+        self.prob, self.alias = alias_row(list(weights))
+        self.n = len(self.values)
+
+    def sample_index(self, rng=random):
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def sample(self, rng=random):
+        return self.values[self.sample_index(rng)]
+
+    def sample_many(self, np_rng, size):
+        prob = np.broadcast_to(np.asarray(self.prob), (size, self.n))
+        alias = np.broadcast_to(np.asarray(self.alias), (size, self.n))
+        return np.asarray(self.values)[sample_alias(prob, alias, np_rng)]
@@ -0,0 +1,136 @@
+import gzip
+import json
+
+FORMAT = "sportsgen-bench-shared"
+VERSION = 1
+# an instance's prompt is system_msg = system, prompt_msg = header + segment
+TABLES = ["system", "header", "segment"]
+# texts are only shared within a game, the writer forgets older ones past this many entries
+MAX_LOOKUP = 1 << 14
+# last line of every task header of benchmark.py
+HEADER_END = "\nTime\tPlay\n"
+
+
+def open_text(fpath, mode='rt'):
+    if fpath.endswith(".gz"):
+        return gzip.open(fpath, mode)
+    return open(fpath, mode[0])
+
+def format_record():
+    return {"format": FORMAT, "version": VERSION, "tables": TABLES}
+
+class SharedTables:
+    """
+        Text ids of one shared-prefix file, for writers fed one instance at a time.
+        stats: optional dict filled with the number of instances and of texts of each table
+    """
+    def __init__(self, stats=None):
+        self.stats = stats if stats is not None else {}
+        self.stats.update({"instances": 0, **{table: 0 for table in TABLES}})
+        self.lookups = {table: {} for table in TABLES}
+
+    def records(self, part):
+        # the texts of part not written yet, then the instance referring to them
+        records = []
+        record = dict(part)
+        for table in TABLES:
+            text = part[table]
+            lookup = self.lookups[table]
+            text_id = lookup.get(text)
+            if text_id is None:
+                if len(lookup) >= MAX_LOOKUP:
+                    lookup.clear()
+                text_id = lookup[text] = self.stats[table]
+                self.stats[table] += 1
+                records.append({"table": table, "id": text_id, "text": text})
+            record[table] = text_id
+        self.stats["instances"] += 1
+        records.append(record)
+        return records
+
+def shared_records(parts, stats=None):
+    """
+        Records of the shared-prefix benchmark format for instance parts
+        {"instance_id", "system", "header", "segment", "truth", ...}: a format line, then every text once as
+        {"table", "id", "text"} right before the first instance that refers to it, and instances
+        {"instance_id", "system": id, "header": id, "segment": id, "truth", ...}.
+        stats: optional dict filled with the number of instances and of texts of each table
+    """
+    tables = SharedTables(stats)
+    yield format_record()
+    for part in parts:
+        yield from tables.records(part)
+
+def expand(record, tables):
+    # back to the {"instance_id", "system_msg", "prompt_msg", "truth", ...} shape of plain benchmark files
+    instance = {key: value for key, value in record.items() if key not in TABLES}
+    instance["system_msg"] = tables["system"][record["system"]]
+    instance["prompt_msg"] = tables["header"][record["header"]] + tables["segment"][record["segment"]]
+    return instance
+
+def is_shared(fpath):
+    with open_text(fpath) as f:
+        line = f.readline()
+    try:
+        return json.loads(line).get("format") == FORMAT
+    except (json.JSONDecodeError, AttributeError):
+        return False
+
+def read_shared(fpath):
+    """
+        Yield the table records and instance references of a shared-prefix file, checking its version.
+    """
+    with open_text(fpath) as f:
+        info = json.loads(f.readline())
+        if info.get("version") != VERSION:
+            raise ValueError(f"{fpath}: unsupported {FORMAT} version {info.get('version')}")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_benchmark(fpath, expand_prompts=True):
+    """
+        Instances of a benchmark file of benchmark.py, plain or shared-prefix, one at a time.
+        Shared texts are kept once in memory and every prompt is only built when its instance is reached.
+        expand_prompts: False to skip building system_msg and prompt_msg (shared-prefix files then yield
+                        the references), e.g. when only the truth is needed
+    """
+    if not is_shared(fpath):
+        with open_text(fpath) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    tables = {table: [] for table in TABLES}
+    for record in read_shared(fpath):
+        if "table" in record:
+            if expand_prompts:
+                tables[record["table"]].append(record["text"])
+            continue
+        yield expand(record, tables) if expand_prompts else record
+
+def read_prefix_ordered(fpath):
+    """
+        Instances of a benchmark file ordered so that those sharing a prompt prefix (system prompt, then
+        task header) are adjacent, which lets a server reuse its prompt cache. Within a prefix the file
+        order is kept. Only the references are sorted, prompts are built lazily.
+    """
+    if not is_shared(fpath):
+        # plain files have no ids, number the system prompts and task headers by first use
+        instances = list(read_benchmark(fpath))
+        systems, headers = {}, {}
+        keys = [(systems.setdefault(i["system_msg"], len(systems)),
+                 headers.setdefault(i["prompt_msg"].split(HEADER_END)[0], len(headers))) for i in instances]
+        for i in sorted(range(len(instances)), key=keys.__getitem__):
+            yield instances[i]
+        return
+    tables = {table: [] for table in TABLES}
+    records = []
+    for record in read_shared(fpath):
+        if "table" in record:
+            tables[record["table"]].append(record["text"])
+        else:
+            records.append(record)
+    # sorted() is stable, ids number the texts in order of first use
+    for record in sorted(records, key=lambda r: (r["system"], r["header"])):
+        yield expand(record, tables)
@@ -0,0 +1,140 @@
+import os
+import json
+import random
+
+import numpy as np
+
+from utils.GameModel import GameModel, MODEL_DIR
+from utils.BatchSimulator import simulate_games_batch
+from utils.NBAPlayer import select_team_players, load_team_profile
+from utils.stats import quarter_statistics, get_encoder
+
+CALIBRATION_VERSION = 2 # bump when the simulated game distribution changes, cached curves are then remeasured
+ALPHA_RANGE = (-1.0, 3.0) # the S:NS ratio grows with alpha, from about 1:2.4 to 1:8.6 with 90/70 teams
+MAX_ITERATIONS = 30
+
+
+def calibration_path(model):
+    # the curve belongs to the model it was measured on
+    return os.path.join(MODEL_DIR, "compiled", f"calibration-{model.source_hash[:16]}.json")
+
+def parse_ratio(ratio):
+    """
+        "1:4.5" -> 4.5, the number of non-scoring plays per scoring play, as printed by games_statistics.
+    """
+    parts = str(ratio).split(":")
+    if len(parts) != 2 or float(parts[0]) != 1:
+        raise ValueError(f"Invalid ratio: {ratio}, expected 1:x")
+    return float(parts[1])
+
+def settings_key(games, seed, strong_team_strength, weak_team_strength):
+    return f"games={games},seed={seed},strength={strong_team_strength}-{weak_team_strength}"
+
+def load_curves(path):
+    # {settings key: [points sorted by alpha]}, empty for a missing or outdated file
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get("version") != CALIBRATION_VERSION:
+        return {}
+    return data["curves"]
+
+def save_curves(path, curves):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"version": CALIBRATION_VERSION, "curves": curves}, f, indent=4)
+    os.replace(tmp_path, path)
+
+def measure_alpha(alpha, games, seed, strong_team_strength, weak_team_strength, count_tokens=False, model=None):
+    """
+        Simulate games with the batch simulator at alpha, the same teams and random numbers for every alpha.
+        Returns {"alpha", "density", "ratio_value", "tokens"} averaged over quarters like games_statistics,
+        tokens is None unless count_tokens.
+    """
+    if model is None:
+        model = GameModel.load()
+    rng = random.Random(seed)
+    teams = [load_team_profile(select_team_players(strong_team_strength, weak_team_strength, rng=rng)) for _ in range(games)]
+    simulations = simulate_games_batch(games, [t[0] for t in teams], [t[1] for t in teams], alpha=alpha, model=model, seed=seed)
+    density, texts = [], []
+    for game in simulations:
+        for quarter in game["pbp"][0:4]:
+            stats, text = quarter_statistics(quarter)
+            density.append(stats["scoring"] / stats["plays"])
+            texts.append(text)
+    density = float(np.mean(density))
+    tokens = None
+    if count_tokens:
+        tokens = float(np.mean([len(t) for t in get_encoder().encode_batch(texts)]))
+    return {"alpha": alpha, "density": density, "ratio_value": (1 - density) / density, "tokens": tokens}
+
+def calibrate_alpha(ratio, games=200, seed=0, strong_team_strength=90, weak_team_strength=70, tolerance=0.01,
+                    count_tokens=False, model=None, verbose=True):
+    """
+        Find the alpha whose simulated games have a target S:NS ratio ("1:x").
+        Points measured with the same settings are cached with the model, a target already within tolerance
+        (relative) of a cached point is returned without simulating, others start from the closest cached bracket.
+        count_tokens: also measure the average tokens per quarter of the returned point
+        Returns (alpha, point).
+    """
+    target = parse_ratio(ratio)
+    if model is None:
+        model = GameModel.load()
+    path = calibration_path(model)
+    curves = load_curves(path)
+    points = curves.setdefault(settings_key(games, seed, strong_team_strength, weak_team_strength), [])
+
+    def measure(alpha, tokens=False):
+        for point in points:
+            if point["alpha"] == alpha and (point["tokens"] is not None or not tokens):
+                return point
+        point = measure_alpha(alpha, games, seed, strong_team_strength, weak_team_strength, count_tokens=tokens, model=model)
+        points[:] = sorted([p for p in points if p["alpha"] != alpha] + [point], key=lambda p: p["alpha"])
+        save_curves(path, curves)
+        if verbose:
+            print(f"alpha {alpha:.4f}: S: NS is 1:{point['ratio_value']:.2f}")
+        return point
+
+    best = min(points, key=lambda p: abs(p["ratio_value"] - target), default=None)
+    if best is None or abs(best["ratio_value"] - target) > tolerance * target:
+        best = search(measure, points, target, tolerance)
+    if count_tokens:
+        best = measure(best["alpha"], tokens=True)
+    return best["alpha"], best
+
+def search(measure, points, target, tolerance):
+    """
+        Regula falsi with the Illinois fix over alpha, starting from the closest cached bracket
+        within ALPHA_RANGE. The simulations have fixed seeds, so the measured ratio
+        is a deterministic, increasing function of alpha.
+    """
+    ends = measure(ALPHA_RANGE[0]), measure(ALPHA_RANGE[1])
+    if not ends[0]["ratio_value"] <= target <= ends[1]["ratio_value"]:
+        raise ValueError(f"Ratio 1:{target} is out of reach, alpha in {ALPHA_RANGE} gives "
+                         f"1:{ends[0]['ratio_value']:.2f} to 1:{ends[1]['ratio_value']:.2f}")
+    in_range = [p for p in points if ALPHA_RANGE[0] <= p["alpha"] <= ALPHA_RANGE[1]]
+    low = max([p for p in in_range if p["ratio_value"] <= target], key=lambda p: p["alpha"])
+    high = min([p for p in in_range if p["ratio_value"] >= target], key=lambda p: p["alpha"])
+
+    f_low, f_high = low["ratio_value"] - target, high["ratio_value"] - target
+    point = low if abs(f_low) < abs(f_high) else high
+    side = 0
+    for _ in range(MAX_ITERATIONS):
+        if abs(point["ratio_value"] - target) <= tolerance * target or high["alpha"] - low["alpha"] < 1e-4:
+            break
+        # interpolate inside the bracket, halve the weight of an end kept twice in a row
+        point = measure(round((low["alpha"] * f_high - high["alpha"] * f_low) / (f_high - f_low), 4))
+        f = point["ratio_value"] - target
+        if f < 0:
+            low, f_low = point, f
+            if side == -1:
+                f_high /= 2
+            side = -1
+        else:
+            high, f_high = point, f
+            if side == 1:
+                f_low /= 2
+            side = 1
+    return point
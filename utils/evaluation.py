@@ -0,0 +1,183 @@
+import re
+import gzip
+import json
+import math
+
+import numpy as np
+
+from utils.metric import bucket_diffs, discount_weights
+from utils.benchfile import read_benchmark
+
+DEFAULT_TOLERANCES = list(range(0, 11))
+# instance ids of benchmark.py: {game}_{quarter}_{step} or {game}_{team}_{quarter}_{step} (player_stats)
+INSTANCE_ID = re.compile(r"^(?P<game>.+?)(?:_(?P<team>team\d+))?_(?P<quarter>\d+)_(?P<step>\d+)$")
+BREAKDOWNS = ["game", "quarter", "step", "team"]
+
+
+def read_jsonl(fpath):
+    opener = gzip.open if fpath.endswith(".gz") else open
+    with opener(fpath, 'rt') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def parse_instance_id(instance_id):
+    """
+        Returns {"game", "team", "quarter", "step"}, team is None for team level instances.
+    """
+    match = INSTANCE_ID.match(instance_id)
+    if match is None:
+        raise ValueError(f"Unrecognized instance id: {instance_id}")
+    return {"game": match["game"], "team": match["team"], "quarter": int(match["quarter"]), "step": int(match["step"])}
+
+def parse_score_block(text):
+    """
+        The last JSON object of a model response, e.g. the {"team1": 25, "team2": 19} block after the reasoning.
+        Returns None when the response has none.
+    """
+    if not text:
+        return None
+    decoder = json.JSONDecoder()
+    block = None
+    pos = text.find("{")
+    while pos >= 0:
+        try:
+            value, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            pos = text.find("{", pos + 1)
+            continue
+        # nested objects are skipped with their parent
+        if isinstance(value, dict):
+            block = value
+        pos = text.find("{", end)
+    return block
+
+def as_number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if math.isfinite(value) else math.nan
+
+def align(instances, predictions):
+    """
+        One row per truth entry (team or player) of every instance.
+        instances: iterable of benchmark instances {"instance_id", "truth": {name: score}}
+        predictions: {instance_id: {name: score}}, missing instances or names are scored as wrong
+        Returns (pred, truth) float arrays and {breakdown: array of labels}.
+    """
+    pred, truth = [], []
+    labels = {name: [] for name in BREAKDOWNS}
+    for instance in instances:
+        info = parse_instance_id(instance["instance_id"])
+        prediction = predictions.get(instance["instance_id"]) or {}
+        if not isinstance(prediction, dict):
+            prediction = {}
+        for name, score in instance["truth"].items():
+            pred.append(as_number(prediction.get(name)))
+            truth.append(float(score))
+            for key in BREAKDOWNS:
+                labels[key].append(info[key] if info[key] is not None else "")
+    return np.array(pred), np.array(truth), {key: np.array(values) for key, values in labels.items()}
+
+def row_statistics(pred, truth, tolerances):
+    """
+        Per-row values whose sums give every metric:
+        columns = DCA hit weight for each tolerance, exact match, absolute error, answered, 1
+    """
+    tolerances = list(tolerances)
+    max_t = max(tolerances)
+    diff = bucket_diffs(pred, truth)
+    answered = ~np.isnan(diff)
+    # unanswered rows land in the last bucket, beyond every tolerance
+    buckets = np.where(answered & (diff <= max_t), np.nan_to_num(diff), max_t + 1).astype(np.int64)
+    weights = np.zeros((len(tolerances), max_t + 2))
+    for i, t in enumerate(tolerances):
+        weights[i, :t + 1] = discount_weights(t)
+    stats = np.empty((len(pred), len(tolerances) + 4))
+    stats[:, :len(tolerances)] = weights[:, buckets].T
+    stats[:, -4] = answered & (diff == 0)
+    stats[:, -3] = np.where(answered, np.abs(pred - truth), 0)
+    stats[:, -2] = answered
+    stats[:, -1] = 1
+    return stats
+
+def metrics_from_sums(sums, tolerances):
+    # sums: (..., len(tolerances) + 4) column sums of row_statistics
+    sums = np.asarray(sums, dtype=float)
+    n = sums[..., -1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "dca": {t: sums[..., i] / n for i, t in enumerate(tolerances)},
+            "exact_match": sums[..., -4] / n,
+            "mae": sums[..., -3] / sums[..., -2],
+            "answered": sums[..., -2] / n,
+            "n": n,
+        }
+
+def cluster_bootstrap(stats, clusters, tolerances, num_samples=1000, confidence=0.95, seed=0):
+    """
+        Percentile intervals of every metric, resampling whole clusters (games) with replacement.
+        clusters: cluster id of every row
+    """
+    codes, cluster_ids = np.unique(clusters, return_inverse=True)
+    cluster_sums = np.stack([np.bincount(cluster_ids, weights=column, minlength=len(codes)) for column in stats.T], axis=1)
+    rng = np.random.default_rng(seed)
+    # how many times each cluster is drawn in each sample
+    picks = rng.integers(0, len(codes), size=(num_samples, len(codes)))
+    picks += np.arange(num_samples)[:, None] * len(codes)
+    draws = np.bincount(picks.ravel(), minlength=num_samples * len(codes)).reshape(num_samples, len(codes)).astype(float)
+    samples = metrics_from_sums(draws @ cluster_sums, tolerances)
+    alpha = (1 - confidence) / 2
+    def interval(values):
+        low, high = np.nanquantile(values, [alpha, 1 - alpha])
+        return [float(low), float(high)]
+    return {
+        "dca": {t: interval(values) for t, values in samples["dca"].items()},
+        "exact_match": interval(samples["exact_match"]),
+        "mae": interval(samples["mae"]),
+    }
+
+def summarize(stats, tolerances):
+    metrics = metrics_from_sums(stats.sum(axis=0), tolerances)
+    return {
+        "n": int(metrics["n"]),
+        "dca": {t: float(v) for t, v in metrics["dca"].items()},
+        "exact_match": float(metrics["exact_match"]),
+        "mae": float(metrics["mae"]),
+        "answered": float(metrics["answered"]),
+    }
+
+def score(pred, truth, labels, tolerances=DEFAULT_TOLERANCES, by=("quarter", "step"), bootstrap=1000, confidence=0.95, seed=0):
+    """
+        DCA at every tolerance, exact match accuracy and MAE, overall and per value of each breakdown in by.
+        Confidence intervals come from a bootstrap over games (bootstrap=0 to skip), not for the game breakdown.
+    """
+    tolerances = list(tolerances)
+    stats = row_statistics(pred, truth, tolerances)
+    report = {"overall": summarize(stats, tolerances), "by": {}}
+    games = np.unique(labels["game"], return_inverse=True)[1]
+    if bootstrap and len(stats):
+        report["overall"]["ci"] = cluster_bootstrap(stats, games, tolerances, bootstrap, confidence, seed)
+    for key in by:
+        levels, level_ids = np.unique(labels[key], return_inverse=True)
+        breakdown = {}
+        for i, level in enumerate(levels.tolist()):
+            rows = level_ids == i
+            breakdown[str(level)] = summarize(stats[rows], tolerances)
+            if bootstrap and key != "game":
+                breakdown[str(level)]["ci"] = cluster_bootstrap(stats[rows], games[rows], tolerances,
+                                                                bootstrap, confidence, seed)
+        report["by"][key] = breakdown
+    return report
+
+def load_predictions(pred_file):
+    """
+        {instance_id: prediction} from a JSON lines file of {"instance_id", "prediction": {name: score}}.
+    """
+    return {row["instance_id"]: row.get("prediction") for row in read_jsonl(pred_file)}
+
+def evaluate_file(bench_file, pred_file, tolerances=DEFAULT_TOLERANCES, by=("quarter", "step"), bootstrap=1000,
+                  confidence=0.95, seed=0):
+    pred, truth, labels = align(read_benchmark(bench_file, expand_prompts=False), load_predictions(pred_file))
+    return score(pred, truth, labels, tolerances, by, bootstrap, confidence, seed)
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+
+from utils import profiling
+
+CONFIG_PATH = "config/openai_key.yaml"
+CACHE_PATH = ".cache/llm_cache.sqlite"
+DEFAULT_ENGINE = "gpt-4o-mini"
+PLACEHOLDER_KEY = "YOUR_API_KEY"
+
+_backend = None
+
+
+def load_config(config_path=CONFIG_PATH):
+    # yaml is only imported when the LLM is actually needed
+    import yaml
+    with open(config_path) as f:
+        return yaml.safe_load(f)
+
+def is_offline(config_path=CONFIG_PATH):
+    """
+        Offline unless a usable key (or a local OpenAI-compatible base-url) is configured.
+        SPORTSGEN_OFFLINE=1 forces offline mode.
+    """
+    if os.environ.get("SPORTSGEN_OFFLINE") == "1":
+        return True
+    if not os.path.exists(config_path):
+        return True
+    config = load_config(config_path) or {}
+    return config.get("api-key", PLACEHOLDER_KEY) == PLACEHOLDER_KEY and not config.get("base-url")
+
+
+class ResponseCache:
+    """
+        Persistent prompt -> response cache in a sqlite file, shared by processes and runs.
+    """
+    def __init__(self, path=CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, key, response):
+        self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?)", (key, response))
+        self.conn.commit()
+
+
+class RateLimiter:
+    """
+        Token buckets for requests and tokens per minute, shared by the coroutines of one event loop.
+        A limit of None is not enforced.
+    """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.available = {k: float(v) for k, v in self.limits.items() if v}
+        self.updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        for k in self.available:
+            self.available[k] = min(self.limits[k], self.available[k] + (now - self.updated) * self.limits[k] / 60)
+        self.updated = now
+
+    async def acquire(self, tokens=0):
+        import asyncio
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # a request larger than the whole budget waits for a full bucket
+        need = {"requests": 1, "tokens": tokens}
+        need = {k: min(need[k], self.limits[k]) for k in self.available}
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = max([(need[k] - self.available[k]) * 60 / self.limits[k] for k in need] + [0])
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            for k in need:
+                self.available[k] -= need[k]
+
+
+class LLMBackend:
+    """
+        OpenAI-compatible chat backend, the clients are created on the first request.
+        base_url: point to a local OpenAI-compatible server (e.g. a stub for testing)
+        concurrency: max requests in flight on the asyncio path
+        max_retries: retries per request, with exponential backoff and jitter
+        rate_limiter: optional RateLimiter applied on the asyncio path
+    """
+    def __init__(self, api_key, model=DEFAULT_ENGINE, parameters=None, base_url=None,
+                 cache_path=CACHE_PATH, concurrency=8, max_retries=5, backoff=1.0, rate_limiter=None):
+        self.api_key = api_key
+        self.model = model
+        self.parameters = parameters or {}
+        self.base_url = base_url
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter
+        self._client = None
+        self._async_client = None
+
+    @classmethod
+    def from_config(cls, config_path=CONFIG_PATH, **kwargs):
+        # keyword arguments take precedence over the config file
+        config = load_config(config_path)
+        options = {"model": config.get("model", DEFAULT_ENGINE), "parameters": config.get("parameters"),
+                   "base_url": config.get("base-url")}
+        options.update(kwargs)
+        return cls(config.get("api-key"), **options)
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._async_client
+
+    def _request(self, messages, params, cache_key=None):
+        # cache_key: extra parts labelling the prompt (e.g. an instance id), the messages are always part of the key
+        # since instance ids repeat across benchmark files
+        kwargs = dict(self.parameters)
+        kwargs.update(params)
+        kwargs.update({"messages": messages, "model": self.model})
+        if cache_key is not None:
+            return kwargs, ResponseCache.key(self.model, cache_key, ResponseCache.key(messages),
+                                             {k: v for k, v in kwargs.items() if k != "messages"})
+        return kwargs, ResponseCache.key(self.model, messages, kwargs)
+
+    @staticmethod
+    def estimate_tokens(kwargs):
+        # rough prompt size (4 characters per token) plus the completion budget, as rate limits count them
+        return sum(len(m["content"]) for m in kwargs["messages"]) // 4 + kwargs.get("max_tokens", 0)
+
+    def _delay(self, attempt):
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def complete(self, messages, **params):
+        """
+            Blocking chat completion, returns the message text or None after max_retries failures.
+        """
+        kwargs, key = self._request(messages, params)
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            profiling.count("llm_cache_hits")
+            return cached
+        profiling.count("llm_requests")
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.chat.completions.create(**kwargs)
+                text = response.choices[0].message.content
+                if self.cache is not None:
+                    self.cache.put(key, text)
+                return text
+            except Exception as e:
+                print(f"Error: {e}")
+                profiling.count("llm_errors")
+                if attempt < self.max_retries:
+                    time.sleep(self._delay(attempt))
+        profiling.count("llm_failures")
+        return None
+
+    async def acomplete(self, messages, semaphore=None, cache_key=None, **params):
+        import asyncio
+        kwargs, key = self._request(messages, params, cache_key)
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            profiling.count("llm_cache_hits")
+            return cached
+        profiling.count("llm_requests")
+        semaphore = semaphore or asyncio.Semaphore(self.concurrency)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire(self.estimate_tokens(kwargs))
+                    response = await self.async_client.chat.completions.create(**kwargs)
+                text = response.choices[0].message.content
+                if self.cache is not None:
+                    self.cache.put(key, text)
+                return text
+            except Exception as e:
+                print(f"Error: {e}")
+                profiling.count("llm_errors")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._delay(attempt))
+        profiling.count("llm_failures")
+        return None
+
+    def complete_batch(self, messages_list, **params):
+        """
+            Send all prompts concurrently (at most self.concurrency in flight), results in input order.
+        """
+        import asyncio
+
+        async def run():
+            semaphore = asyncio.Semaphore(self.concurrency)
+            return await asyncio.gather(*[self.acomplete(m, semaphore, **params) for m in messages_list])
+        return asyncio.run(run())
+
+
+def get_backend():
+    """
+        Process-wide backend created on first use, None when running offline.
+    """
+    global _backend
+    if _backend is None and not is_offline():
+        _backend = LLMBackend.from_config()
+    return _backend
+
+
+def point_messages(text):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": f"Calculate the points for this play description. \n\nExample 1:\nText: makes jump bank shot\nPoint: 2\n\nText: {text}\nPoints:"}
+    ]
+
+def parse_points_llm(texts):
+    """
+        Ask the LLM for the points of several play descriptions in one concurrent batch.
+        Returns one int per text, None when offline or the answer is not a number.
+    """
+    backend = get_backend()
+    if backend is None:
+        return [None] * len(texts)
+    answers = backend.complete_batch([point_messages(text) for text in texts])
+    points = []
+    for answer in answers:
+        try:
+            points.append(int(answer.strip().lower()))
+        except (AttributeError, ValueError):
+            points.append(None)
+    return points
@@ -0,0 +1,219 @@
+import os
+import pickle
+import hashlib
+
+import numpy as np
+
+# bump when the layout of the counts artifact changes
+FIT_VERSION = 1
+MAX_ORDER = 4 # longest context counted, chains of any order up to it come from the same counts
+BACKOFF_MIN_COUNT = 20 # contexts seen fewer times back off to their longest suffix seen often enough
+
+
+def sequences_digest(seqs, digest=None):
+    # running sha256 of the counted sequences, to recognise a file that only grew
+    digest = digest or hashlib.sha256()
+    for seq in seqs:
+        digest.update(("\x1f".join(seq) + "\x1e").encode())
+    return digest
+
+def encode_sequences(seqs, events):
+    """
+        Flat integer codes of seqs and the start offset of every sequence, events (list) is extended with
+        the events not seen yet so that existing codes stay valid.
+    """
+    index = {event: i for i, event in enumerate(events)}
+    for seq in seqs:
+        for event in seq:
+            if event not in index:
+                index[event] = len(events)
+                events.append(event)
+    lengths = np.fromiter((len(seq) for seq in seqs), dtype=np.int64, count=len(seqs))
+    codes = np.fromiter((index[event] for seq in seqs for event in seq), dtype=np.int64, count=int(lengths.sum()))
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    return codes, offsets, lengths
+
+def count_ngrams(codes, offsets, lengths, order):
+    """
+        Transitions from every context of order events to the next event, within sequences.
+        Returns (rows, counts): rows[i] = (context..., next event) codes in order of first occurrence.
+    """
+    position = np.arange(len(codes)) - np.repeat(offsets, lengths)
+    ends = np.flatnonzero(position >= order)
+    rows = np.stack([codes[ends - order + j] for j in range(order + 1)], axis=1)
+    if len(rows) == 0:
+        return rows, np.zeros(0, dtype=np.int64)
+    unique, first, inverse, counts = np.unique(rows, axis=0, return_index=True, return_inverse=True, return_counts=True)
+    by_first = np.argsort(first, kind="stable")
+    return unique[by_first], counts[by_first]
+
+def merge_counts(rows, counts, new_rows, new_counts):
+    # add new n-gram counts, n-grams seen for the first time are appended in their order
+    all_rows = np.concatenate([rows, new_rows])
+    unique, first, inverse = np.unique(all_rows, axis=0, return_index=True, return_inverse=True)
+    total = np.bincount(inverse.ravel(), weights=np.concatenate([counts, new_counts]), minlength=len(unique))
+    by_first = np.argsort(first, kind="stable")
+    return unique[by_first], total[by_first].astype(np.int64)
+
+
+class NgramCounts:
+    """
+        Transition counts of the real event sequences for contexts of 1..max_order events.
+        events: event of every code, counts: {order: (rows, counts)} of count_ngrams
+        num_sequences, digest: the sequences counted so far, so that appended sequences are counted on their own
+    """
+    def __init__(self, max_order=MAX_ORDER):
+        self.max_order = max_order
+        self.events = []
+        self.counts = {order: (np.zeros((0, order + 1), dtype=np.int64), np.zeros(0, dtype=np.int64))
+                       for order in range(1, max_order + 1)}
+        self.num_sequences = 0
+        self.digest = sequences_digest([]).hexdigest()
+
+    def update(self, seqs):
+        # count seqs on top of the current counts
+        seqs = list(seqs)
+        if not seqs:
+            return self
+        codes, offsets, lengths = encode_sequences(seqs, self.events)
+        for order in range(1, self.max_order + 1):
+            new_rows, new_counts = count_ngrams(codes, offsets, lengths, order)
+            self.counts[order] = merge_counts(*self.counts[order], new_rows, new_counts)
+        self.num_sequences += len(seqs)
+        return self
+
+    @classmethod
+    def fit(cls, seqs, max_order=MAX_ORDER):
+        counts = cls(max_order).update(seqs)
+        counts.digest = sequences_digest(seqs).hexdigest()
+        return counts
+
+    def first_order_graph(self):
+        """
+            {event: {next_event: {"weight": prob}}} with events in the order build_tree_with_probabilities
+            adds them to its graph, events without successors map to {}.
+        """
+        rows, counts = self.counts[1]
+        totals = np.bincount(rows[:, 0], weights=counts, minlength=len(self.events))
+        weights = counts / totals[rows[:, 0]]
+        graph = {}
+        for (u, v), weight in zip(rows.tolist(), weights.tolist()):
+            graph.setdefault(self.events[u], {})[self.events[v]] = {"weight": weight}
+            graph.setdefault(self.events[v], {})
+        return graph
+
+    def chain(self, order, min_count=BACKOFF_MIN_COUNT, start_events=("start", "vs"), end="end"):
+        """
+            Variable order Markov chain over contexts of at most order events, for TurnSampler.
+            A context seen fewer than min_count times backs off to its longest suffix seen often enough
+            (single events are always kept), and a state moves to the longest kept suffix of its context
+            followed by the next event. Every context ending a turn is merged into the single end state.
+            Returns (states, matrix, state_events, start_states) over the states reachable from the start.
+        """
+        if not 1 <= order <= self.max_order:
+            raise ValueError(f"Markov order {order} out of 1..{self.max_order}")
+        rows_by_context = {}
+        kept = {(event,) for event in self.events}
+        for k in range(1, order + 1):
+            rows, counts = self.counts[k]
+            totals = {}
+            for row, count in zip(rows.tolist(), counts.tolist()):
+                context = tuple(self.events[c] for c in row[:-1])
+                totals[context] = totals.get(context, 0) + count
+                rows_by_context.setdefault(context, []).append((self.events[row[-1]], count))
+            if k > 1:
+                kept |= {context for context, total in totals.items() if total >= min_count}
+
+        def next_state(context, event):
+            if event == end:
+                return (end,)
+            candidate = (context + (event,))[-order:]
+            while candidate not in kept:
+                candidate = candidate[1:]
+            return candidate
+
+        start_states = {}
+        for i, event in enumerate(start_events):
+            state = next_state(start_events[:i], event) if i else (event,)
+            start_states[event] = state
+        # states reachable from the starts, the end state is always there
+        states = {(end,)}
+        frontier = list(start_states.values())
+        while frontier:
+            state = frontier.pop()
+            if state in states:
+                continue
+            states.add(state)
+            frontier.extend(next_state(state, event) for event, _ in rows_by_context.get(state, []))
+        states = sorted(states)
+        index = {state: i for i, state in enumerate(states)}
+        matrix = np.zeros((len(states), len(states)))
+        for state in states:
+            successors = rows_by_context.get(state, [])
+            total = sum(count for _, count in successors)
+            for event, count in successors:
+                matrix[index[state], index[next_state(state, event)]] += count / total
+        return states, matrix, [state[-1] for state in states], {e: index[s] for e, s in start_states.items()}
+
+    def to_artifact(self):
+        return {
+            "version": FIT_VERSION,
+            "max_order": self.max_order,
+            "events": self.events,
+            "counts": self.counts,
+            "num_sequences": self.num_sequences,
+            "digest": self.digest,
+        }
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        counts = cls(artifact["max_order"])
+        counts.events = artifact["events"]
+        counts.counts = artifact["counts"]
+        counts.num_sequences = artifact["num_sequences"]
+        counts.digest = artifact["digest"]
+        return counts
+
+    def save(self, file_path):
+        # write-then-rename, like the compiled game model
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.to_artifact(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        # None for a missing or outdated artifact
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'rb') as f:
+            artifact = pickle.load(f)
+        if artifact.get("version") != FIT_VERSION:
+            return None
+        return cls.from_artifact(artifact)
+
+
+def counts_path(model_dir, max_order=MAX_ORDER):
+    return os.path.join(model_dir, "compiled", f"ngram_counts-k{max_order}.pkl")
+
+def fit_counts(seqs, file_path, max_order=MAX_ORDER):
+    """
+        Counts of seqs, reusing the counts saved in file_path: when seqs starts with the sequences counted
+        there only the new ones are counted, any other change refits from scratch. Saves the result.
+        Returns (counts, number of sequences counted by this call).
+    """
+    counts = NgramCounts.load(file_path)
+    if counts is not None and counts.max_order == max_order and counts.num_sequences <= len(seqs):
+        digest = sequences_digest(seqs[:counts.num_sequences])
+        if digest.hexdigest() == counts.digest:
+            new_seqs = seqs[counts.num_sequences:]
+            if not new_seqs:
+                return counts, 0
+            counts.update(new_seqs)
+            counts.digest = sequences_digest(new_seqs, digest).hexdigest()
+            counts.save(file_path)
+            return counts, len(new_seqs)
+    counts = NgramCounts.fit(seqs, max_order)
+    counts.save(file_path)
+    return counts, len(seqs)
@@ -1,5 +1,6 @@
 
 import numpy as np
+from functools import lru_cache
 
 def load_buckets(total, buckets):
    bucket_list = [0] # keep buckt range [1, 4, 8] ==> (1,4] (4,8]
@@ -16,26 +17,27 @@ def discount_factors(buckets):
    discount_factor = np.arange(0, 1, 1/(buckets+1)).tolist()
    return discount_factor
 
+@lru_cache(maxsize=None)
+def discount_weights(buckets):
+   # 1 - discount_factors(buckets) as an array, built once per tolerance
+   discount_factor = discount_factors(buckets)
+   assert len(discount_factor) == buckets + 1, (buckets + 1, len(discount_factor))
+   return 1 - np.array(discount_factor)
+
+def bucket_diffs(pred_list, tgt_list):
+   # diff in (t-1, t] falls in bucket t, as the loop over bucket_list did
+   pred = np.asarray(pred_list, dtype=float)
+   tgt = np.asarray(tgt_list, dtype=float)
+   n = min(len(pred), len(tgt))
+   return np.ceil(np.abs(tgt[:n] - pred[:n]))
+
 def DCA(pred_list, tgt_list, bucket_num):
-   bucket_size = 1
-   bucket_num = bucket_num
-
-   # initialization
-   bucket_list, counter = load_buckets(bucket_size*bucket_num, bucket_num)
-   discount_factor = discount_factors(bucket_num)
-   assert len(bucket_list) == len(discount_factor), (len(bucket_list), len(discount_factor))
-
-   # count occurences of diff value in each bucket
-   for tgt, pred in zip(tgt_list, pred_list):
-       diff = abs(tgt - pred)
-       for i, upper_bound in enumerate(bucket_list):
-           if diff <= upper_bound:
-               counter[i] += 1
-               break
-   # print(discount_factor)
+   # count occurences of diff value in each bucket, diffs beyond bucket_num are not counted
+   diff = bucket_diffs(pred_list, tgt_list)
+   counter = np.bincount(diff[diff <= bucket_num].astype(np.int64), minlength=bucket_num+1)
 
    # calculate discounted accuracy
-   p_b = np.array(counter)/len(pred_list) # indicator/total
-   discounted_accuracy = np.sum(p_b * (1 - np.array(discount_factor)))
+   p_b = counter/len(pred_list) # indicator/total
+   discounted_accuracy = np.sum(p_b * discount_weights(bucket_num))
 
-   return discounted_accuracy
\ No newline at end of file
+   return discounted_accuracy
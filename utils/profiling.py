@@ -0,0 +1,136 @@
+import json
+import time
+import contextlib
+
+# checked by hot paths before timing anything, stays False unless a run asks for a profile
+enabled = False
+
+_stages = {} # name: [seconds, calls]
+_counters = {} # name: count
+_distributions = {} # name: {value: count}
+_null_stage = contextlib.nullcontext()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    _stages.clear()
+    _counters.clear()
+    _distributions.clear()
+
+def now():
+    return time.perf_counter()
+
+def lap(name, start):
+    """
+        Add the time since start to stage name and return the current time, for consecutive stages in a loop:
+            t = lap("sample_turn", t)
+    """
+    end = time.perf_counter()
+    record = _stages.setdefault(name, [0.0, 0])
+    record[0] += end - start
+    record[1] += 1
+    return end
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        lap(self.name, self.start)
+
+def stage(name):
+    # with stage("write"): ... times the block, a shared no-op context when profiling is off
+    return _Stage(name) if enabled else _null_stage
+
+def count(name, n=1):
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+def observe(name, value):
+    if enabled:
+        histogram = _distributions.setdefault(name, {})
+        histogram[value] = histogram.get(value, 0) + 1
+
+def collect(reset_after=False):
+    """
+        Raw measurements of this process, to be merged into the parent's with merge().
+    """
+    data = {"stages": {k: list(v) for k, v in _stages.items()}, "counters": dict(_counters),
+            "distributions": {k: dict(v) for k, v in _distributions.items()}}
+    if reset_after:
+        reset()
+    return data
+
+def merge(data):
+    for name, (seconds, calls) in data["stages"].items():
+        record = _stages.setdefault(name, [0.0, 0])
+        record[0] += seconds
+        record[1] += calls
+    for name, n in data["counters"].items():
+        _counters[name] = _counters.get(name, 0) + n
+    for name, histogram in data["distributions"].items():
+        target = _distributions.setdefault(name, {})
+        for value, n in histogram.items():
+            # JSON turns the values into strings
+            value = int(value) if isinstance(value, str) and value.lstrip("-").isdigit() else value
+            target[value] = target.get(value, 0) + n
+
+def report(wall_seconds=None):
+    distributions = {}
+    for name, histogram in _distributions.items():
+        total = sum(histogram.values())
+        distributions[name] = {
+            "count": total,
+            "mean": sum(v * n for v, n in histogram.items()) / total,
+            "min": min(histogram),
+            "max": max(histogram),
+            "histogram": {str(v): histogram[v] for v in sorted(histogram)},
+        }
+    return {
+        "wall_seconds": wall_seconds,
+        # stages run in worker processes are summed, they can add up to more than the wall time
+        "stages": {name: {"seconds": s, "calls": c} for name, (s, c) in sorted(_stages.items(), key=lambda x: -x[1][0])},
+        "counters": dict(sorted(_counters.items())),
+        "distributions": distributions,
+    }
+
+@contextlib.contextmanager
+def profile_run(report_path, pstats=False):
+    """
+        Profile the body of the with statement and save the report as JSON to report_path.
+        pstats: also dump the cProfile stats of this process to report_path with a ".pstats" suffix
+    """
+    reset()
+    enable()
+    profiler = None
+    if pstats:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(report_path.rsplit(".json", 1)[0] + ".pstats")
+        disable()
+        data = report(wall)
+        with open(report_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        print(f"Profile saved to {report_path}")
+        for name, record in list(data["stages"].items())[:8]:
+            print(f"  {name:<20} {record['seconds']:9.3f} s  {record['calls']:9d} calls")
@@ -0,0 +1,76 @@
+from itertools import accumulate
+
+
+def initial_team_scores(pbp_data):
+    init_score = {}
+    for play in pbp_data[0]:
+        if play['ScoringPlay']:
+            init_score[play['team']] = 0
+        if len(init_score.keys()) == 2:
+            break
+    return init_score
+
+def prefix_sums(values):
+    return [0] + list(accumulate(values))
+
+class ScoreIndex:
+    """
+        Cumulative scores over the plays of every quarter of a game, per team and, for games with structured
+        play fields, per player index of the team. The truth of any window [start, end) of a quarter's plays
+        is then one subtraction per team or player instead of a walk over the window.
+    """
+    def __init__(self, pbp_data, team_players=None):
+        self.initial_teams = list(initial_team_scores(pbp_data))
+        self.structured = "player" in pbp_data[0][0] and team_players is not None
+        self.team_players = team_players
+        self.quarters = [self.index_quarter(quarter, team_players) for quarter in pbp_data]
+
+    def index_quarter(self, quarter, team_players):
+        teams = {play['team'] for play in quarter if play['ScoringPlay']}
+        points, next_play, players = {}, {}, {}
+        for team in teams:
+            scored = [play['points'] if play['ScoringPlay'] and play['team'] == team else 0 for play in quarter]
+            points[team] = prefix_sums(scored)
+            # index of the next scoring play of the team, a team missing from the initial scores
+            # enters the truth in the order of its first scoring play in the window
+            following = [len(quarter)] * (len(quarter) + 1)
+            for i in range(len(quarter) - 1, -1, -1):
+                scoring = quarter[i]['ScoringPlay'] and quarter[i]['team'] == team
+                following[i] = i if scoring else following[i + 1]
+            next_play[team] = following
+            if self.structured:
+                columns = []
+                for player in range(len(team_players[team])):
+                    columns.append(prefix_sums(play['points'] if play['ScoringPlay'] and play['team'] == team
+                                               and play['player'] == player else 0 for play in quarter))
+                players[team] = columns
+        return {"points": points, "next_play": next_play, "players": players}
+
+    def team_truth(self, quarter_id, start, end):
+        """
+            {team: points} of plays [start, end) of a quarter (0-based), with the teams of the first quarter's
+            scoring plays always present.
+        """
+        index = self.quarters[quarter_id]
+        truth = {team: 0 for team in self.initial_teams}
+        entering = sorted((next_play[start], team) for team, next_play in index["next_play"].items()
+                          if team not in truth and next_play[start] < end)
+        for _, team in entering:
+            truth[team] = 0
+        for team in truth:
+            points = index["points"].get(team)
+            if points is not None:
+                truth[team] = points[end] - points[start]
+        return truth
+
+    def player_truth(self, quarter_id, start, end, team):
+        """
+            Points of every player index of team in plays [start, end) of a quarter, None for games without
+            structured play fields or an index built without team_players.
+        """
+        if not self.structured:
+            return None
+        columns = self.quarters[quarter_id]["players"].get(team)
+        if columns is None:
+            return [0] * len(self.team_players[team])
+        return [column[end] - column[start] for column in columns]
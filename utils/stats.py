@@ -1,10 +1,25 @@
 import os
 import json
-import tiktoken
 import numpy as np
 from glob import glob
+from multiprocessing import Pool
 
-enc = tiktoken.get_encoding("cl100k_base")
+from utils.GameStore import Shard, is_game_store, list_shards
+
+CACHE_DIR = ".sportsgen" # tooling files next to the games, not matched by "*.json"
+CACHE_FILE = "stats_cache.jsonl"
+SUMMARY_FILE = "statistics.json"
+CHUNK_SIZE = 64 # games per tokenizer batch / worker task
+
+_encoder = None
+
+def get_encoder():
+    # tiktoken and the cl100k_base encoder are loaded on first use only
+    global _encoder
+    if _encoder is None:
+        import tiktoken
+        _encoder = tiktoken.get_encoding("cl100k_base")
+    return _encoder
 
 def is_number(input_value):
     try:
@@ -31,76 +46,183 @@ def load_quarters(file_list):
             quarters.extend(game_quarter)
     return quarters
 
-def games_statistics(folder_path):
+def quarter_statistics(quarter):
+    """
+        One pass over a quarter: #plays, #scoring plays, #turns, #free throw, #otherScore, [team1, team2] points
+        and the "time\\tdescription" text used for token counting.
+    """
+    scoring = 0
+    total_turn = 0
+    total_free_throw = 0
+    total_other = 0
+    points_list = [0,0]
+    cur_team = None
+    lines = []
+    for play in quarter:
+        lines.append(play['time'] + "\t" + play['description'])
+        if play['ScoringPlay']:
+            scoring += 1
+            if "free throw" in play['description']:
+                total_free_throw += 1
+            else:
+                total_other += 1
+                gain_team = 0 if play['team'] == "team1" else 1
+                points_list[gain_team] += play['points']
+        # count turns
+        if play['team'] is not None and play['team'] != cur_team:
+            cur_team = play['team']
+            total_turn += 1
+    stats = {"plays": len(quarter), "scoring": scoring, "turns": total_turn,
+             "free_throw": total_free_throw, "other_score": total_other, "quarter_score": points_list}
+    return stats, "\n".join(lines)
+
+def read_unit(path):
+    # a game_{id}.json file or a shard folder of a game store
+    if os.path.isdir(path):
+        yield from Shard(path).iter_games()
+    else:
+        with open(path, 'r') as f:
+            yield os.path.basename(path).split(".")[0], json.load(f)
+
+def chunk_statistics(unit_list):
+    """
+        Per-game statistics of a chunk of game files (or store shards), tokens are counted with one batched encode call.
+        Returns [(unit path, {game name: [quarter stats]})].
+    """
+    units = []
+    texts = []
+    for path in unit_list:
+        unit_stats = {}
+        for game_name, game in read_unit(path):
+            game_stats = []
+            for quarter in game["pbp"][0:4]:
+                stats, text = quarter_statistics(quarter)
+                game_stats.append(stats)
+                texts.append(text)
+            unit_stats[game_name] = game_stats
+        units.append((path, unit_stats))
+    token_counts = iter(len(tokens) for tokens in get_encoder().encode_batch(texts))
+    for _, unit_stats in units:
+        for game_stats in unit_stats.values():
+            for stats in game_stats:
+                stats["tokens"] = next(token_counts)
+    return units
+
+def file_key(fpath):
+    st = os.stat(fpath)
+    return [st.st_mtime_ns, st.st_size]
+
+def load_units(folder_path):
+    # shards are never modified once written, their folder mtime is enough
+    if is_game_store(folder_path):
+        return [os.path.join(folder_path, d) for d in list_shards(folder_path)]
+    return load_folder(folder_path)
+
+def load_stats_cache(cache_path):
+    # append-only JSON lines, the last entry of a file wins; a torn last line is ignored
+    cache = {}
+    if not os.path.exists(cache_path):
+        return cache
+    with open(cache_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry["stats"], dict):
+                cache[entry["file"]] = entry
+    return cache
+
+def collect_game_statistics(folder_path, workers=1, use_cache=True):
+    """
+        Per-game statistics of every game in folder_path (game_{id}.json files or a game store),
+        {game name: [quarter stats]}.
+        Results are cached in {folder_path}/.sportsgen/stats_cache.jsonl keyed by file (or shard) name, mtime and size,
+        so reruns only parse new or modified games.
+    """
+    cache_path = os.path.join(folder_path, CACHE_DIR, CACHE_FILE)
+    cache = load_stats_cache(cache_path) if use_cache else {}
+    unit_list = load_units(folder_path)
+    keys = {os.path.basename(path): file_key(path) for path in unit_list}
+    todo = [path for path in unit_list
+            if os.path.basename(path) not in cache or cache[os.path.basename(path)]["key"] != keys[os.path.basename(path)]]
+
+    chunk_size = 1 if is_game_store(folder_path) else CHUNK_SIZE
+    chunks = [todo[i:i+chunk_size] for i in range(0, len(todo), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with Pool(workers) as pool:
+            results = pool.imap(chunk_statistics, chunks)
+            new_entries = [unit for chunk in results for unit in chunk]
+    else:
+        new_entries = [unit for chunk in chunks for unit in chunk_statistics(chunk)]
+
+    if use_cache and new_entries:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # rewrite when most cached entries are stale, otherwise append the new units
+        stale = len(cache) - sum(1 for name in cache if name in keys)
+        mode = 'w' if stale > len(keys) // 2 else 'a'
+        lines = []
+        if mode == 'w':
+            lines = [json.dumps(entry) + "\n" for name, entry in cache.items() if name in keys]
+        for path, unit_stats in new_entries:
+            entry = {"file": os.path.basename(path), "key": keys[os.path.basename(path)], "stats": unit_stats}
+            cache[entry["file"]] = entry
+            lines.append(json.dumps(entry) + "\n")
+        with open(cache_path, mode) as f:
+            f.writelines(lines)
+    elif not use_cache:
+        for path, unit_stats in new_entries:
+            cache[os.path.basename(path)] = {"stats": unit_stats}
+    return {game_name: game_stats for name in keys for game_name, game_stats in cache[name]["stats"].items()}
+
+def summarize_statistics(game_stats):
+    """
+        Aggregate per-game statistics into the quarter level summary printed by games_statistics.
+    """
+    quarters = [q for stats in game_stats.values() for q in stats]
+    plays = np.array([q["plays"] for q in quarters])
+    density = np.array([q["scoring"] / q["plays"] for q in quarters])
+    tokens = np.array([q["tokens"] for q in quarters])
+    turns = np.array([q["turns"] for q in quarters])
+    scores = np.array([q["quarter_score"] for q in quarters])
+    ratio_value = (1 - np.mean(density))/np.mean(density)
+    summary = {
+        "games": len(game_stats),
+        "quarters": len(quarters),
+        "ratio": f"1:{round(ratio_value, 1)}",
+        "ratio_value": float(ratio_value),
+        "density": float(np.mean(density)),
+    }
+    for name, values in [("plays", plays), ("tokens", tokens), ("turns", turns)]:
+        summary[name] = {"avg": float(np.mean(values)), "min": int(values.min()), "max": int(values.max())}
+    summary["free_throw"] = float(np.sum([q["free_throw"] for q in quarters]) / len(quarters))
+    summary["other_score"] = float(np.sum([q["other_score"] for q in quarters]) / len(quarters))
+    # calculate win rate
+    summary["team1_win_rate"] = float(np.mean(scores[:, 0] > scores[:, 1]))
+    summary["team2_win_rate"] = float(np.mean(scores[:, 0] < scores[:, 1]))
+    summary["draw_rate"] = float(np.mean(scores[:, 0] == scores[:, 1]))
+    return summary
+
+def games_statistics(folder_path, workers=1, use_cache=True):
     """
         Analyzing quarter sattistics
         1. #plays/turn {ave_play, play_range}
         2. density: scoring move/total_move, {avg_density, density_range}
         3. #tokens {avg_token, token_range}
         4. #turns {avg_turn, turn_range}
+        The summary is also saved as JSON in {folder_path}/.sportsgen/statistics.json and returned.
     """
-    file_list = load_folder(folder_path)
-    # load all quarters
-    quarters = load_quarters(file_list)
-    statistic_dict = {"#plays":[], "density":[], "#tokens":[], "#turns":[],"#free throw":[], "#otherScore":[], "game_score":[]}
-
-    for quarter in quarters:
-        statistic_dict['#plays'].append(len(quarter))
-        statistic_dict['density'].append(len([play for play in quarter if play['ScoringPlay']])/len(quarter))
-
-        # count tokens
-        total_text = "\n".join([play['time'] + "\t" + play['description'] for play in quarter])
-        tokens = enc.encode(total_text)
-        statistic_dict['#tokens'].append(len(tokens))
-
-        # count turns
-        cur_team = None
-        total_turn = 0
-        for play in quarter:
-            if play['team'] is None:
-                continue
-            team = play['team']
-            if team != cur_team:
-                cur_team = team
-                total_turn += 1
-        statistic_dict['#turns'].append(total_turn)
-        
-        # count free throw
-        points_list = [0,0]
-        total_other = 0
-        total_free_throw = 0
-        for play in quarter:
-            if "free throw" in play['description'] and play['ScoringPlay']:
-                total_free_throw += 1
-            elif play['ScoringPlay']:
-                total_other += 1
-                gain_points = play['points']
-                gain_team = 0 if play['team'] == "team1" else 1
-                points_list[gain_team] += gain_points
-        statistic_dict['#free throw'].append(total_free_throw)
-        statistic_dict['#otherScore'].append(total_other)
-        # print(points_list)
-        statistic_dict['game_score'].append(points_list)
-    # calculate statistics
-    ratio_value = (1 - np.mean(statistic_dict['density']))/np.mean(statistic_dict['density'])
+    summary = summarize_statistics(collect_game_statistics(folder_path, workers, use_cache))
     print("############# Simulations Statistics #############")
-    print(f"S: NS is 1:{round(ratio_value, 1)}")
-    print(f"average #plays: {np.mean(statistic_dict['#plays'])}, min: {min(statistic_dict['#plays'])}, max: {max(statistic_dict['#plays'])}")
-    print(f"average #tokens: {np.mean(statistic_dict['#tokens'])}, min: {min(statistic_dict['#tokens'])}, max: {max(statistic_dict['#tokens'])}")
-    print(f"average #turns: {np.mean(statistic_dict['#turns'])}, min: {min(statistic_dict['#turns'])}, max: {max(statistic_dict['#turns'])}")
-    print(f"# free thow: {np.sum(statistic_dict['#free throw'])/len(statistic_dict['#plays'])},\
-           # other score: {np.sum(statistic_dict['#otherScore'])/len(statistic_dict['#plays'])}")
-    
-    # calculate win rate
-    team1_win = 0
-    team2_win = 0
-    draw = 0
-    for i in statistic_dict['game_score']:
-        if i[0] > i[1]:
-            team1_win += 1
-        elif i[0] < i[1]:
-            team2_win += 1
-        else:
-            draw += 1
-    print(f"team1 win rate: {team1_win/len(statistic_dict['game_score'])}, team2 win rate: {team2_win/len(statistic_dict['game_score'])}, draw rate: {draw/len(statistic_dict['game_score'])}")
-    return
\ No newline at end of file
+    print(f"S: NS is {summary['ratio']}")
+    for name in ["plays", "tokens", "turns"]:
+        print(f"average #{name}: {summary[name]['avg']}, min: {summary[name]['min']}, max: {summary[name]['max']}")
+    print(f"# free thow: {summary['free_throw']},\
+           # other score: {summary['other_score']}")
+    print(f"team1 win rate: {summary['team1_win_rate']}, team2 win rate: {summary['team2_win_rate']}, draw rate: {summary['draw_rate']}")
+
+    summary_path = os.path.join(folder_path, CACHE_DIR, SUMMARY_FILE)
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=4)
+    return summary
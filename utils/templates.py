@@ -0,0 +1,140 @@
+import re
+import random
+
+SLOT_PATTERN = re.compile(r'<(.*?)>')
+SHOT_WORDS = ["layup", "dunk", "tip", "jump shot", "jumper", "hook shot", "step back jump"]
+
+
+def template_points(text):
+    """
+        Points of a "make" description, same rules as GameGenerator.parse_points.
+        Returns (points, ambiguous), ambiguous when no rule recognised the shot and the
+        default of 2 points was used.
+    """
+    text = text.lower()
+    ddd = re.findall(r'\d+', text)
+    if "free throw" in text:
+        return 1, False
+    elif len(ddd)>0:
+        distance = int(ddd[0])
+        if distance < 23:
+            return 2, False
+        elif distance == 23 and "three" not in text:
+            return 2, False
+        else:
+            return 3, False
+    elif "two" in text:
+        return 2, False
+    elif "three" in text:
+        return 3, False
+    return 2, not any(word in text for word in SHOT_WORDS)
+
+
+class CompiledTemplate:
+    """
+        A description template split once into literal/slot parts.
+        parts: literals at even positions, slot ids (into slots) at odd positions
+        slots: distinct slots in order of appearance as (kind, position), kind is
+               "team", "position" (filled by the player at that position if the team has one) or "random"
+        actor: slot of the acting player (the scorer of a "make"), the first player slot, None without one
+        assist: slot of the assisting player, the first player slot after the word "assist", None without one
+    """
+    __slots__ = ("text", "points", "free_throw", "parts", "slots", "actor", "assist")
+
+    def __init__(self, text, points=0):
+        self.text = text
+        self.points = points
+        self.free_throw = "free throw" in text
+        self.parts = []
+        self.slots = []
+        self.actor = None
+        self.assist = None
+        names = []
+        after_assist = False
+        for i, part in enumerate(SLOT_PATTERN.split(text)):
+            if i % 2 == 0:
+                self.parts.append(part)
+                after_assist = after_assist or "assist" in part.lower()
+                continue
+            # same slot text is replaced by the same name, as str.replace does in fill_in_players
+            if part not in names:
+                names.append(part)
+                self.slots.append(resolve_slot(part))
+            slot = names.index(part)
+            self.parts.append(slot)
+            if self.slots[slot][0] == "team":
+                continue
+            if after_assist and self.assist is None:
+                self.assist = slot
+            elif self.actor is None:
+                self.actor = slot
+
+    def fill(self, team_name, player_name_dict, rng=random):
+        return self.fill_players(team_name, player_name_dict, rng=rng)[0]
+
+    def fill_players(self, team_name, player_name_dict, rng=random):
+        """
+            Fill the slots, returns (text, players): the player of every slot as an index into
+            player_name_dict's order (the game's team_players list), None for team slots.
+        """
+        positions = {pos: i for i, pos in enumerate(player_name_dict)}
+        players = self.draw_players(positions, rng=rng)
+        return self.render(team_name, [player['name'] for player in player_name_dict.values()], players), players
+
+    def draw_players(self, positions, rng=random):
+        # player index of every slot, positions: {position: index} of the team's players, None for team slots
+        players = []
+        for kind, pos in self.slots:
+            if kind == "team":
+                players.append(None)
+            elif kind == "position" and pos in positions:
+                players.append(positions[pos])
+            else:
+                players.append(rng.randrange(len(positions)))
+        return players
+
+    def render(self, team_name, names, players):
+        # text of the template with the slot players of draw_players, names: the team's player names
+        parts = self.parts.copy()
+        for i in range(1, len(parts), 2):
+            player = players[parts[i]]
+            parts[i] = team_name if player is None else names[player]
+        return "".join(parts)
+
+    def roles(self, players):
+        # (acting player, assisting player) of the slot players returned by fill_players
+        return (None if self.actor is None else players[self.actor],
+                None if self.assist is None else players[self.assist])
+
+
+def resolve_slot(name):
+    if "team" in name.lower():
+        return "team", None
+    elif "-" in name:
+        return "position", name.split("-")[1].upper()
+    return "random", None
+
+
+def compile_templates(verb_to_desc, point_overrides=None):
+    """
+        Compile every template of desc_template.json.
+        point_overrides: {template: points} taking precedence over the rules (LLM answers)
+        Returns ({event: [CompiledTemplate]}, {event: index of the first "free throw" template or None},
+                 [ambiguous "make" templates]).
+    """
+    templates = {}
+    free_throw_index = {}
+    ambiguous = []
+    for event, candidates in verb_to_desc.items():
+        compiled = []
+        for text in candidates:
+            points = 0
+            if event == "make":
+                points, unclear = template_points(text)
+                if unclear:
+                    ambiguous.append(text)
+                points = (point_overrides or {}).get(text, points)
+            compiled.append(CompiledTemplate(text, points))
+        templates[event] = compiled
+        free_throw_index[event] = next((i for i, t in enumerate(compiled) if t.free_throw), None)
+    return templates, free_throw_index, ambiguous